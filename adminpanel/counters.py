@@ -0,0 +1,183 @@
+import logging
+from datetime import timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+from ambuk_backend.routers import primary_reads
+from drivers.models import Driver
+from rides.models import Ride, ArchivedRide
+from ws.dashboard import publish_counter_changes
+from .models import DashboardCounter
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+TOTAL_USERS = 'users.total'
+TOTAL_DRIVERS = 'drivers.total'
+TOTAL_RIDES = 'rides.total'
+
+def driver_status_key(status):
+    return f'drivers.status.{status}'
+
+def ride_status_key(status):
+    return f'rides.status.{status}'
+
+def ride_hour_key(moment):
+    return f"rides.hour.{moment.astimezone(dt_timezone.utc):%Y-%m-%dT%H}"
+
+def hourly_retention():
+    return getattr(settings, 'DASHBOARD_HOURLY_RETENTION_HOURS', 48)
+
+def increment(changes):
+    """Apply {counter name: delta} with atomic F() updates, creating missing counters"""
+    changes = {name: delta for name, delta in changes.items() if delta}
+    if not changes:
+        return
+    for name, delta in changes.items():
+        if DashboardCounter.objects.filter(name=name).update(value=F('value') + delta):
+            continue
+        try:
+            with transaction.atomic():
+                DashboardCounter.objects.create(name=name, value=delta)
+        except IntegrityError:
+            # Created concurrently - apply the delta to that row instead
+            DashboardCounter.objects.filter(name=name).update(value=F('value') + delta)
+    
+    # Live admin dashboards get the deltas on their next tick
+    publish_counter_changes(changes)
+
+def ride_status_changes(old_status, new_status):
+    if old_status == new_status:
+        return {}
+    changes = {}
+    if old_status:
+        changes[ride_status_key(old_status)] = -1
+    if new_status:
+        changes[ride_status_key(new_status)] = 1
+    return changes
+
+def driver_status_changes(old_status, new_status):
+    if old_status == new_status:
+        return {}
+    changes = {}
+    if old_status:
+        changes[driver_status_key(old_status)] = -1
+    if new_status:
+        changes[driver_status_key(new_status)] = 1
+    return changes
+
+def record_ride_created(ride):
+    changes = {TOTAL_RIDES: 1, ride_hour_key(ride.created_at): 1}
+    changes.update(ride_status_changes(None, ride.status))
+    increment(changes)
+
+def record_ride_deleted(ride, status):
+    changes = {TOTAL_RIDES: -1}
+    changes.update(ride_status_changes(status, None))
+    increment(changes)
+
+def record_ride_transition(old_status, new_status):
+    """Hook for status changes, including ones made with queryset.update()"""
+    increment(ride_status_changes(old_status, new_status))
+
+def record_driver_created(driver):
+    changes = {TOTAL_DRIVERS: 1}
+    changes.update(driver_status_changes(None, driver.status))
+    increment(changes)
+
+def record_driver_deleted(driver, status):
+    changes = {TOTAL_DRIVERS: -1}
+    changes.update(driver_status_changes(status, None))
+    increment(changes)
+
+def record_driver_transition(old_status, new_status):
+    """Hook for status changes, including ones made with queryset.update()"""
+    increment(driver_status_changes(old_status, new_status))
+
+def record_user_created(user):
+    if user.user_type == 'USER':
+        increment({TOTAL_USERS: 1})
+
+def record_user_deleted(user):
+    if user.user_type == 'USER':
+        increment({TOTAL_USERS: -1})
+
+def recent_hour_keys(hours=24, now=None):
+    now = now or timezone.now()
+    return [ride_hour_key(now - timedelta(hours=h)) for h in range(hours - 1, -1, -1)]
+
+def snapshot(hours=24):
+    """Read every dashboard counter in a single query"""
+    names = [TOTAL_USERS, TOTAL_DRIVERS, TOTAL_RIDES]
+    names += [driver_status_key(s) for s, _ in Driver.STATUS_CHOICES]
+    names += [ride_status_key(s) for s, _ in Ride.STATUS_CHOICES]
+    hour_keys = recent_hour_keys(hours)
+    values = dict(DashboardCounter.objects.filter(name__in=names + hour_keys).values_list('name', 'value'))
+
+    if TOTAL_RIDES not in values:
+        # Never reconciled (fresh install) - build the counters once. Read
+        # on a replica this may only mean the replica lags, so check the primary
+        with primary_reads():
+            values = dict(DashboardCounter.objects.filter(name__in=names + hour_keys).values_list('name', 'value'))
+            if TOTAL_RIDES not in values:
+                values = reconcile()
+
+    return {
+        'total_users': values.get(TOTAL_USERS, 0),
+        'total_drivers': values.get(TOTAL_DRIVERS, 0),
+        'total_rides': values.get(TOTAL_RIDES, 0),
+        'drivers_by_status': {s: values.get(driver_status_key(s), 0) for s, _ in Driver.STATUS_CHOICES},
+        'rides_by_status': {s: values.get(ride_status_key(s), 0) for s, _ in Ride.STATUS_CHOICES},
+        'rides_per_hour': [{'hour': key.rsplit('.', 1)[1], 'count': values.get(key, 0)} for key in hour_keys],
+    }
+
+def reconcile():
+    """Recount everything from the source tables and overwrite the counters.
+
+    Counts on the primary, even when called from a replica-reading view, so
+    a lagging replica can never overwrite the counters with stale totals.
+    """
+    since = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=hourly_retention())
+
+    with primary_reads(), transaction.atomic():
+        values = {
+            TOTAL_USERS: User.objects.filter(user_type='USER').count(),
+            TOTAL_DRIVERS: Driver.objects.count(),
+            # Archived rides still count; they only left the hot table
+            TOTAL_RIDES: Ride.objects.count() + ArchivedRide.objects.count(),
+        }
+        values.update({driver_status_key(s): 0 for s, _ in Driver.STATUS_CHOICES})
+        values.update({ride_status_key(s): 0 for s, _ in Ride.STATUS_CHOICES})
+        for row in Driver.objects.values('status').annotate(n=Count('id')):
+            values[driver_status_key(row['status'])] = row['n']
+        for model in (Ride, ArchivedRide):
+            for row in model.objects.values('status').annotate(n=Count('id')):
+                values[ride_status_key(row['status'])] += row['n']
+
+        values.update({ride_hour_key(since + timedelta(hours=h)): 0 for h in range(hourly_retention() + 1)})
+        hourly = (Ride.objects.filter(created_at__gte=since)
+                  .annotate(hour=TruncHour('created_at', tzinfo=dt_timezone.utc))
+                  .values('hour').annotate(n=Count('id')))
+        for row in hourly:
+            values[ride_hour_key(row['hour'])] = row['n']
+
+        existing = {c.name: c for c in DashboardCounter.objects.select_for_update().filter(name__in=values)}
+        for name, value in values.items():
+            if name in existing:
+                existing[name].value = value
+        DashboardCounter.objects.bulk_update(existing.values(), ['value'])
+        DashboardCounter.objects.bulk_create(
+            [DashboardCounter(name=name, value=value) for name, value in values.items() if name not in existing]
+        )
+
+        # Drop hourly buckets that fell out of the retention window
+        stale = [name for name in DashboardCounter.objects.filter(name__startswith='rides.hour.')
+                 .exclude(name__in=values).values_list('name', flat=True)
+                 if name.rsplit('.', 1)[1] < f"{since:%Y-%m-%dT%H}"]
+        DashboardCounter.objects.filter(name__in=stale).delete()
+
+    logger.info(f"Reconciled {len(values)} dashboard counters")
+    return values
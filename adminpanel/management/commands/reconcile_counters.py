@@ -0,0 +1,18 @@
+import time
+from django.core.management.base import BaseCommand
+from adminpanel import counters
+
+class Command(BaseCommand):
+    help = 'Recount the admin dashboard counters from the users, drivers and rides tables'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Keep running and reconcile every INTERVAL seconds')
+    
+    def handle(self, *args, **options):
+        while True:
+            values = counters.reconcile()
+            self.stdout.write(f"Reconciled {len(values)} counters")
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
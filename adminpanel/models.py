@@ -0,0 +1,10 @@
+from django.db import models
+
+class DashboardCounter(models.Model):
+    """A precomputed count shown on the admin dashboard, kept current by adminpanel.counters"""
+    name = models.CharField(max_length=64, unique=True)
+    value = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name}: {self.value}"
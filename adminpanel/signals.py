@@ -0,0 +1,59 @@
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from django.contrib.auth import get_user_model
+from drivers.models import Driver
+from rides.models import Ride, ArchivedRide
+from ws.dashboard import publish_ride_status, publish_driver_status
+from . import counters
+
+User = get_user_model()
+
+# Remember the status each instance was loaded with, so a save can tell
+# which per-status counters it moved between
+
+@receiver(post_init, sender=Ride)
+@receiver(post_init, sender=Driver)
+def remember_status(sender, instance, **kwargs):
+    instance._counted_status = instance.__dict__.get('status')
+
+@receiver(post_save, sender=Ride)
+def count_ride_save(sender, instance, created, **kwargs):
+    if created:
+        counters.record_ride_created(instance)
+    elif instance._counted_status is not None:
+        counters.record_ride_transition(instance._counted_status, instance.status)
+    if created or instance._counted_status != instance.status:
+        publish_ride_status(instance.id, instance.status)
+    instance._counted_status = instance.status
+
+@receiver(post_delete, sender=Ride)
+def count_ride_delete(sender, instance, **kwargs):
+    counters.record_ride_deleted(instance, instance._counted_status)
+
+@receiver(post_delete, sender=ArchivedRide)
+def count_archived_ride_delete(sender, instance, **kwargs):
+    # Archived rides still count (see rides.archive), e.g. until their user is deleted
+    counters.record_ride_deleted(instance, instance.status)
+
+@receiver(post_save, sender=Driver)
+def count_driver_save(sender, instance, created, **kwargs):
+    if created:
+        counters.record_driver_created(instance)
+    elif instance._counted_status is not None:
+        counters.record_driver_transition(instance._counted_status, instance.status)
+    if created or instance._counted_status != instance.status:
+        publish_driver_status(instance.id, instance.status)
+    instance._counted_status = instance.status
+
+@receiver(post_delete, sender=Driver)
+def count_driver_delete(sender, instance, **kwargs):
+    counters.record_driver_deleted(instance, instance._counted_status)
+
+@receiver(post_save, sender=User)
+def count_user_save(sender, instance, created, **kwargs):
+    if created:
+        counters.record_user_created(instance)
+
+@receiver(post_delete, sender=User)
+def count_user_delete(sender, instance, **kwargs):
+    counters.record_user_deleted(instance)
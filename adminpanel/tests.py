@@ -0,0 +1,38 @@
+from django.test import TestCase
+from rest_framework.test import APIClient
+from ambuk_backend.testing import LISTING_PARAMS, assert_max_queries, create_driver, create_rides
+from users.models import User
+
+class ListingQueryBudgetTest(TestCase):
+    """Admin listings run the same number of queries for a few rows as for many"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(email='admin@example.com', username='admin',
+                                                           user_type='ADMIN'))
+
+    def assert_constant_queries(self, url, budget, add_rows):
+        for rows in (2, 40):
+            add_rows(rows)
+            for params in LISTING_PARAMS:
+                with self.subTest(rows=rows, params=params), assert_max_queries(budget):
+                    response = self.client.get(url + params)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                    self.assertEqual(response.status_code, 200)
+
+    def test_list_rides(self):
+        def add_rows(count):
+            for n in range(count):
+                user = User.objects.create(email=f'patient{n}-{count}@example.com', username=f'patient{n}-{count}')
+                create_rides(2, user, create_driver(f'{n}-{count}') if n % 2 else None)
+
+        # One query on the live and one on the archived rides
+        self.assert_constant_queries('/api/admin/rides/', 2, add_rows)
+
+    def test_list_drivers(self):
+        def add_rows(count):
+            for n in range(count):
+                create_driver(f'{n}-{count}')
+
+        self.assert_constant_queries('/api/admin/drivers/', 1, add_rows)
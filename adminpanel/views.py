@@ -2,26 +2,33 @@
 from rest_framework import status, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework_simplejwt.tokens import RefreshToken
+from users.tokens import tokens_for_user
 from django.contrib.auth import authenticate, get_user_model
 from drivers.serializers import DriverSerializer
 from drivers.models import Driver
-from rides.models import Ride
+from rides.archive import ride_history
 from rides.serializers import RideDetailSerializer
+from ambuk_backend.pagination import list_response
+from ambuk_backend.routers import ReplicaReadMixin
+from . import counters
+from users.ratelimit import LoginRateThrottle, login_succeeded
 
 User = get_user_model()
 
 class AdminLoginView(APIView):
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [LoginRateThrottle]
     
     def post(self, request):
         email = request.data.get('email')
         password = request.data.get('password')
         
         user = authenticate(username=email, password=password)
+        if user:
+            login_succeeded(email)
         
         if user and user.user_type == 'ADMIN':
-            refresh = RefreshToken.for_user(user)
+            refresh = tokens_for_user(user)
             
             return Response({
                 'refresh': str(refresh),
@@ -49,39 +56,34 @@ class CreateDriverView(APIView):
             return Response(DriverSerializer(driver).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class ListDriversView(APIView):
+class ListDriversView(ReplicaReadMixin, APIView):
     permission_classes = [IsAdminPermission]
     
     def get(self, request):
-        drivers = Driver.objects.all()
-        serializer = DriverSerializer(drivers, many=True)
-        return Response(serializer.data)
+        drivers = Driver.objects.select_related('user')
+        return list_response(request, drivers, DriverSerializer)
 
-class ListRidesView(APIView):
+class ListRidesView(ReplicaReadMixin, APIView):
     permission_classes = [IsAdminPermission]
     
     def get(self, request):
-        rides = Ride.objects.all().order_by('-created_at')
-        serializer = RideDetailSerializer(rides, many=True)
-        return Response(serializer.data)
+        return list_response(request, ride_history(), RideDetailSerializer)
 
-class DashboardView(APIView):
+class DashboardView(ReplicaReadMixin, APIView):
     permission_classes = [IsAdminPermission]
     
     def get(self, request):
-        # Simple statistics for admin dashboard
-        total_users = User.objects.filter(user_type='USER').count()
-        total_drivers = Driver.objects.count()
-        active_drivers = Driver.objects.filter(status='AVAILABLE').count()
-        total_rides = Ride.objects.count()
-        pending_rides = Ride.objects.filter(status='REQUESTED').count()
-        completed_rides = Ride.objects.filter(status='COMPLETED').count()
+        # Counters are maintained incrementally, so this is one small query
+        stats = counters.snapshot()
         
         return Response({
-            'total_users': total_users,
-            'total_drivers': total_drivers,
-            'active_drivers': active_drivers,
-            'total_rides': total_rides,
-            'pending_rides': pending_rides,
-            'completed_rides': completed_rides
+            'total_users': stats['total_users'],
+            'total_drivers': stats['total_drivers'],
+            'active_drivers': stats['drivers_by_status']['AVAILABLE'],
+            'total_rides': stats['total_rides'],
+            'pending_rides': stats['rides_by_status']['REQUESTED'],
+            'completed_rides': stats['rides_by_status']['COMPLETED'],
+            'drivers_by_status': stats['drivers_by_status'],
+            'rides_by_status': stats['rides_by_status'],
+            'rides_per_hour': stats['rides_per_hour'],
         })
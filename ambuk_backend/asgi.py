@@ -1,17 +1,24 @@
-
 import os
 from django.core.asgi import get_asgi_application
-from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
-from ws.routing import websocket_urlpatterns
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ambuk_backend.settings')
+# Set up Django before importing anything that touches the models
+django_asgi_app = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter
+from ws.auth import JWTAuthMiddleware
+from ws.routing import websocket_urlpatterns
 
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
-    "websocket": AuthMiddlewareStack(
+    "http": django_asgi_app,
+    # Consumers use scope['identity'] from the token; no session or user lookup on connect
+    "websocket": JWTAuthMiddleware(
         URLRouter(
             websocket_urlpatterns
         )
     ),
 })
+
+# Rebuild the offer timers of rides still waiting for a driver
+from rides.redispatch import redispatcher
+redispatcher.start()
@@ -0,0 +1,131 @@
+import importlib.util
+import logging
+import os
+import django
+from django.core.exceptions import ImproperlyConfigured
+
+logger = logging.getLogger(__name__)
+
+# OPTIONS['pool'] (with psycopg 3 and psycopg_pool) and the SQLite
+# 'init_command' and 'transaction_mode' options need Django 5.1
+HAS_DB_OPTIONS_51 = django.VERSION >= (5, 1)
+
+# PRAGMAs for single-node SQLite: readers never block the writer (WAL),
+# writers wait for the lock instead of failing at once, and commits skip
+# the fsync that WAL makes unnecessary for consistency
+SQLITE_TUNING = (
+    'PRAGMA journal_mode=WAL;'
+    'PRAGMA synchronous=NORMAL;'
+    'PRAGMA mmap_size=268435456;'
+    'PRAGMA cache_size=-65536;'
+    'PRAGMA temp_store=MEMORY;'
+)
+
+PROFILES = ('sqlite', 'sqlite-wal', 'postgres')
+
+def database_profile(profile, base_dir, env=os.environ):
+    """DATABASES['default'] for a profile name.
+
+    sqlite:     the plain file with default journaling
+    sqlite-wal: the same file tuned for concurrent requests on one node
+                (Django 5.1+; older versions get plain sqlite and a warning)
+    postgres:   persistent connections, or a psycopg connection pool with
+                DB_POOL_MAX_SIZE set (Django 5.1+ and psycopg[pool], else
+                ImproperlyConfigured); configured by the POSTGRES_* variables
+    """
+    if profile == 'postgres':
+        config = {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': env.get('POSTGRES_DB', 'ambuk'),
+            'USER': env.get('POSTGRES_USER', 'ambuk'),
+            'PASSWORD': env.get('POSTGRES_PASSWORD', ''),
+            'HOST': env.get('POSTGRES_HOST', 'localhost'),
+            'PORT': env.get('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': int(env.get('DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+        pool_size = int(env.get('DB_POOL_MAX_SIZE', 0))
+        if pool_size:
+            if not HAS_DB_OPTIONS_51 or importlib.util.find_spec('psycopg_pool') is None:
+                raise ImproperlyConfigured('DB_POOL_MAX_SIZE needs Django 5.1+ with psycopg 3 and psycopg_pool '
+                                           '(pip install "psycopg[pool]")')
+            # Pooled connections are returned after each request instead of kept open
+            config['CONN_MAX_AGE'] = 0
+            config['OPTIONS']['pool'] = {
+                'min_size': int(env.get('DB_POOL_MIN_SIZE', 2)),
+                'max_size': pool_size,
+                'timeout': int(env.get('DB_POOL_TIMEOUT', 10)),
+            }
+        return config
+
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown DATABASE_PROFILE {profile!r}, expected one of {', '.join(PROFILES)}")
+    config = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': env.get('SQLITE_PATH', base_dir / 'db.sqlite3'),
+    }
+    if profile == 'sqlite-wal' and not HAS_DB_OPTIONS_51:
+        logger.warning(f"Django {django.get_version()} cannot apply the sqlite-wal tuning (needs 5.1+); "
+                       "using default SQLite settings")
+        config['OPTIONS'] = {'timeout': int(env.get('SQLITE_BUSY_TIMEOUT', 20))}
+    elif profile == 'sqlite-wal':
+        config['OPTIONS'] = {
+            'init_command': SQLITE_TUNING,
+            # Take the write lock when a transaction starts, so a transaction
+            # that reads first cannot deadlock on upgrading its lock later
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': int(env.get('SQLITE_BUSY_TIMEOUT', 20)),
+        }
+    return config
+
+def replica_databases(primary, env=os.environ):
+    """Read replica aliases (replica_0, replica_1, ...) of the primary config.
+
+    PostgreSQL replicas are listed in POSTGRES_REPLICA_HOSTS (host or
+    host:port, comma separated); SQLite ones in SQLITE_REPLICA_PATHS, e.g. a
+    copy of the database file for trying the routing out locally.
+    """
+    if primary['ENGINE'] == 'django.db.backends.postgresql':
+        targets = [
+            dict(zip(('HOST', 'PORT'), host.strip().split(':', 1)))
+            for host in env.get('POSTGRES_REPLICA_HOSTS', '').split(',') if host.strip()
+        ]
+    else:
+        targets = [{'NAME': path.strip()} for path in env.get('SQLITE_REPLICA_PATHS', '').split(',') if path.strip()]
+
+    # Tests read the primary through the replica aliases
+    return {
+        f'replica_{i}': {**primary, 'OPTIONS': dict(primary.get('OPTIONS', {})), **target, 'TEST': {'MIRROR': 'default'}}
+        for i, target in enumerate(targets)
+    }
+
+# Backends whose entries only the process that wrote them can see
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+def cache_config(env=os.environ):
+    """CACHES['default'] from CACHE_URL.
+
+    redis://...: RedisCache (needs redis-py), shared by every process
+    a path:      FileBasedCache in that directory, shared on one machine
+    unset:       LocMemCache, private to each process
+    """
+    url = env.get('CACHE_URL', '')
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': url}
+    if url:
+        return {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': url}
+    return {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+
+def require_shared_cache(databases, caches):
+    """Refuse read replicas without a shared default cache.
+
+    The window in which a user's reads stay on the primary after a write is
+    kept in that cache; in a per-process one a request served by another
+    worker would miss it and read its own write from a lagging replica.
+    """
+    if len(databases) > 1 and caches['default']['BACKEND'] in PROCESS_LOCAL_CACHES:
+        raise ImproperlyConfigured('Read replicas need a shared cache: set CACHE_URL to redis://... or a directory')
@@ -0,0 +1,163 @@
+import base64
+import heapq
+from itertools import islice
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+class KeysetPaginator:
+    """Newest-first cursor pagination on (created_at, id).
+
+    The cursor encodes the last row of the previous page, so each page is a
+    range scan on the (created_at, id) index rather than an OFFSET that has to
+    skip every earlier row.
+    """
+
+    def __init__(self, default_limit=50, max_limit=500):
+        self.default_limit = default_limit
+        self.max_limit = max_limit
+
+    def encode_cursor(self, obj):
+        raw = f"{obj.created_at.isoformat()}|{obj.pk}"
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            created_at, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+            created_at = parse_datetime(created_at)
+            if created_at is None:
+                raise ValueError(cursor)
+            return created_at, int(pk)
+        except (ValueError, UnicodeDecodeError):
+            raise ValidationError({'cursor': 'Invalid cursor'})
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params.get('limit', self.default_limit))
+        except ValueError:
+            raise ValidationError({'limit': 'Must be an integer'})
+        return max(1, min(limit, self.max_limit))
+
+    def page(self, queryset, cursor=None, limit=None):
+        """Return (rows, next_cursor) for the page after `cursor`"""
+        limit = limit or self.default_limit
+        queryset = queryset.order_by('-created_at', '-pk')
+        if cursor:
+            created_at, pk = self.decode_cursor(cursor)
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+
+        rows = list(queryset[:limit + 1])
+        next_cursor = self.encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+        return rows[:limit], next_cursor
+
+    def get_paginated_response(self, request, queryset, serializer_class):
+        rows, next_cursor = self.page(queryset, request.query_params.get('cursor'), self.get_limit(request))
+        return Response({
+            'results': serializer_class(rows, many=True).data,
+            'next_cursor': next_cursor,
+        })
+
+class MergedListing:
+    """Querysets of similar rows listed as one newest-first sequence.
+
+    Supports what KeysetPaginator, list_response and list serializers use -
+    order_by, filter, using, slicing and iteration - applying each to every
+    queryset and merging the results on (created_at, pk). A keyset page
+    therefore costs one range scan per queryset.
+    """
+
+    def __init__(self, *querysets):
+        self.querysets = querysets
+
+    def order_by(self, *fields):
+        return MergedListing(*(queryset.order_by(*fields) for queryset in self.querysets))
+
+    def filter(self, *args, **kwargs):
+        return MergedListing(*(queryset.filter(*args, **kwargs) for queryset in self.querysets))
+
+    def using(self, alias):
+        return MergedListing(*(queryset.using(alias) for queryset in self.querysets))
+
+    @property
+    def db(self):
+        return self.querysets[0].db
+
+    def _merge(self, iterables):
+        return heapq.merge(*iterables, key=lambda obj: (obj.created_at, obj.pk), reverse=True)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice) or index.start or index.step:
+            raise TypeError('MergedListing only supports [:n] slices')
+        return list(islice(self._merge(queryset[:index.stop] for queryset in self.querysets), index.stop))
+
+    def __iter__(self):
+        return self.iterator()
+
+    def iterator(self, chunk_size=500):
+        return self._merge(queryset.iterator(chunk_size=chunk_size) for queryset in self.querysets)
+
+def stream_json_array(queryset, serializer_class, chunk_size=500):
+    """Yield a JSON array of serialized rows, chunk by chunk, from a server-side iterator"""
+    renderer = JSONRenderer()
+    yield b'['
+    first = True
+    batch = []
+
+    def render(rows):
+        # Strip the surrounding brackets so chunks join into one array
+        return renderer.render(serializer_class(rows, many=True).data)[1:-1]
+
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        batch.append(obj)
+        if len(batch) == chunk_size:
+            yield render(batch) if first else b',' + render(batch)
+            first = False
+            batch = []
+    if batch:
+        yield render(batch) if first else b',' + render(batch)
+    yield b']'
+
+async def iterate_in_thread(chunks):
+    """Async iterator over a synchronous one, advanced a chunk at a time.
+
+    ASGI servers buffer a StreamingHttpResponse built on a sync iterator
+    before sending any of it. Each step here runs on the thread Django uses
+    for sync code, so a database cursor stays on the connection it opened.
+    """
+    step = sync_to_async(next, thread_sensitive=True)
+    done = object()
+    try:
+        while (chunk := await step(chunks, done)) is not done:
+            yield chunk
+    finally:
+        # Close the server-side cursor too if the client went away early
+        await sync_to_async(chunks.close, thread_sensitive=True)()
+
+def list_response(request, queryset, serializer_class, paginator=None):
+    """Render a newest-first listing.
+
+    ?cursor= or ?limit= returns one keyset page with a next_cursor, ?stream=1
+    streams the whole listing as a chunked JSON array, and no parameters keeps
+    the original plain list.
+    """
+    paginator = paginator or KeysetPaginator()
+    params = request.query_params
+
+    if 'cursor' in params or 'limit' in params:
+        return paginator.get_paginated_response(request, queryset, serializer_class)
+
+    queryset = queryset.order_by('-created_at', '-pk')
+    if params.get('stream') in ('1', 'true'):
+        # The body is read after the view returns, outside any replica routing it set up
+        queryset = queryset.using(queryset.db)
+        chunks = stream_json_array(queryset, serializer_class)
+        if isinstance(request._request, ASGIRequest):
+            chunks = iterate_in_thread(chunks)
+        return StreamingHttpResponse(chunks, content_type='application/json')
+
+    return Response(serializer_class(queryset, many=True).data)
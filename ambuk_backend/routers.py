@@ -0,0 +1,82 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+
+# Database alias the current request reads from, when it reads from a replica
+_read_alias = ContextVar('read_alias', default=None)
+
+def replicas():
+    return [alias for alias in settings.DATABASES if alias != 'default']
+
+def sticky_key(user_id):
+    return f'db-sticky-primary:{user_id}'
+
+def stick_to_primary(user):
+    """Serve the user's reads from the primary for REPLICA_STICKY_SECONDS after a write.
+
+    Keeps read-your-writes across replication lag: a patient who just booked
+    or cancelled sees the ride in their history straight away. The window is
+    kept in the default cache, which must be shared (e.g. Redis) when
+    several processes serve requests.
+    """
+    if replicas() and user is not None and user.is_authenticated:
+        cache.set(sticky_key(user.id), True, getattr(settings, 'REPLICA_STICKY_SECONDS', 5))
+
+def read_alias_for(user):
+    """The replica for this user's reads, or None while they are stuck to the primary"""
+    aliases = replicas()
+    if not aliases:
+        return None
+    if user is not None and user.is_authenticated and cache.get(sticky_key(user.id)):
+        return None
+    return random.choice(aliases)
+
+@contextmanager
+def primary_reads():
+    """Read from the primary inside the block, even in a replica-reading view"""
+    token = _read_alias.set(None)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+class ReplicaRouter:
+    """Sends reads to a replica only inside views that opted in with ReplicaReadMixin.
+
+    Everything else, including every write and every read in a request
+    that writes, stays on the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+class ReplicaReadMixin:
+    """Serve the view's GET/HEAD/OPTIONS requests from a read replica.
+
+    The replica is chosen per request and forgotten in finalize_response, so
+    a streamed body that is read later must be built from querysets already
+    bound to it (as ambuk_backend.pagination.list_response does).
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS:
+            # Set after authentication, so the user itself is read from the primary
+            self._read_alias_token = _read_alias.set(read_alias_for(request.user))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_read_alias_token', None)
+        if token is not None:
+            _read_alias.reset(token)
+            self._read_alias_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
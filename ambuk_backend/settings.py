@@ -2,6 +2,8 @@
 import os
 from datetime import timedelta
 from pathlib import Path
+from .databases import cache_config, database_profile, replica_databases, require_shared_cache
+from users.hashers import password_hashers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -69,12 +71,45 @@ WSGI_APPLICATION = 'ambuk_backend.wsgi.application'
 ASGI_APPLICATION = 'ambuk_backend.asgi.application'
 
 # Database
+# DATABASE_PROFILE: 'sqlite-wal' (single node), 'sqlite' (default journaling)
+# or 'postgres' (POSTGRES_* variables; DB_POOL_MAX_SIZE enables pooling).
+# The WAL tuning and pooling need Django 5.1+, pooling also psycopg[pool].
+# Compare them with `python manage.py bench_booking`.
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_profile(os.environ.get('DATABASE_PROFILE', 'sqlite-wal'), BASE_DIR),
+}
+# Read replicas (POSTGRES_REPLICA_HOSTS or SQLITE_REPLICA_PATHS) serve the
+# history, admin list and dashboard reads; see ambuk_backend.routers
+DATABASES.update(replica_databases(DATABASES['default']))
+DATABASE_ROUTERS = ['ambuk_backend.routers.ReplicaRouter']
+REPLICA_STICKY_SECONDS = 5  # Seconds a user's reads stay on the primary after they book or cancel
+
+# Cache: CACHE_URL=redis://host:6379/0 (or a directory for a file cache on
+# one machine); unset keeps a per-process cache, which replicas refuse
+CACHES = {
+    'default': cache_config(),
 }
+require_shared_cache(DATABASES, CACHES)
+
+# Password hashing: PASSWORD_HASHER=argon2 (needs argon2-cffi), bcrypt (needs
+# bcrypt) or pbkdf2; unset picks the first of those installed. Stored hashes
+# of another hasher or cost are upgraded on the next successful login.
+# Compare them with `python manage.py bench_login`.
+PASSWORD_HASHERS = password_hashers(os.environ.get('PASSWORD_HASHER'))
+ARGON2_TIME_COST = 2
+ARGON2_MEMORY_COST = 19456  # KiB
+ARGON2_PARALLELISM = 1
+BCRYPT_ROUNDS = 12
+# PBKDF2 follows Django's default iterations, which rise with each release;
+# PBKDF2_ITERATIONS overrides them (lower only together with the rate limits below)
+if os.environ.get('PBKDF2_ITERATIONS'):
+    PBKDF2_ITERATIONS = int(os.environ['PBKDF2_ITERATIONS'])
+
+# Login rate limits, checked before any password is hashed
+LOGIN_RATE_BURST = 10  # Failed attempts an email may make at once
+LOGIN_RATE_PER_MINUTE = 6  # ... and regains per minute
+LOGIN_IP_RATE_BURST = 100  # Attempts from one client address at once
+LOGIN_IP_RATE_PER_MINUTE = 60
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -114,7 +149,10 @@ REST_FRAMEWORK = {
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
-    ]
+    ],
+    # Reverse proxies in front of the app; throttles key on the client address
+    # they saw. 0 ignores X-Forwarded-For, which clients can forge
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
 }
 
 # JWT Settings
@@ -137,3 +175,100 @@ CHANNEL_LAYERS = {
         # },
     },
 }
+
+# Several ASGI workers on one machine without Redis: set CHANNEL_LAYER=sharded
+# and start the brokers first with `python manage.py run_channel_broker`.
+# Only websocket messages cross workers this way. Streamed positions
+# (drivers.positions), reconnect replay (ws.replay) and login rate limits
+# (users.ratelimit) stay per process; their docstrings say how each drifts.
+# The dispatch index (drivers.geo), live tracking (ws.tracking) and cached
+# ride payloads (rides.payloads) catch up from the database every
+# DISPATCH_INDEX_TTL / RIDE_TRACKING_LOOKUP_TTL / RIDE_PAYLOAD_CACHE_TTL seconds
+CHANNEL_BROKER_SOCKETS = [
+    f'/tmp/ambuk-channels-{i}.sock' for i in range(int(os.environ.get('CHANNEL_BROKER_SHARDS', 2)))
+]
+if os.environ.get('CHANNEL_LAYER') == 'sharded':
+    CHANNEL_LAYERS['default'] = {
+        'BACKEND': 'ws.layers.ShardedChannelLayer',
+        'CONFIG': {
+            'hosts': CHANNEL_BROKER_SOCKETS,
+            'capacity': 100,  # Messages queued per channel before sends to it fail
+            'expiry': 60,  # Seconds an undelivered message is kept
+            'channel_capacity': {
+                'specific.*': 500,  # Consumer channels of busy drivers and dashboards
+            },
+        },
+    }
+
+# Websocket notifications are queued and sent by a background worker.
+# Use 'ws.dispatch.ImmediateOutbox' to send inline (e.g. in tests).
+WS_OUTBOX = {
+    'BACKEND': 'ws.dispatch.LocalOutbox',
+    'OPTIONS': {
+        'batch_size': 200,
+        'max_retries': 5,
+        'retry_delay': 0.5,  # Seconds, doubled on every retry
+    },
+}
+
+# Ride dispatch: offer new rides to the nearest available drivers only
+DISPATCH_RADIUS_KM = 10
+DISPATCH_MAX_DRIVERS = 20
+DISPATCH_GRID_CELL_DEG = 0.01  # ~1.1 km grid cells for the driver location index
+DISPATCH_INDEX_TTL = 5  # Seconds before the index is reloaded with other workers' driver changes (None: never)
+DISPATCH_FALLBACK_TO_BROADCAST = True  # Notify all available drivers when none are located nearby
+DISPATCH_MODE = 'broadcast'  # 'batched' offers each ride to one driver picked by rides.matching
+
+# Batched matching (DISPATCH_MODE = 'batched'); simulate with `python manage.py simulate_matching`
+MATCHING_WINDOW = 1.5  # Seconds of ride requests solved together
+MATCHING_STRATEGY = 'optimal'  # 'optimal' (least total pickup distance, needs numpy) or 'greedy'
+MATCHING_CANDIDATES_PER_RIDE = 10  # Nearest available drivers considered per ride
+MATCHING_OFFER_TIMEOUT = 15  # Seconds an offered driver is held back from other matches
+MATCHING_MAX_WINDOWS = 3  # Windows a ride may go unmatched before it is broadcast
+
+# Re-dispatch of unaccepted rides: each expired offer widens the search radius
+REDISPATCH_OFFER_TIMEOUT = 20  # Seconds an offer may go unaccepted before the ride is re-dispatched
+REDISPATCH_RADIUS_GROWTH = 1.5  # Radius multiplier per round, starting from DISPATCH_RADIUS_KM
+REDISPATCH_MAX_RADIUS_KM = 30
+REDISPATCH_MAX_ROUNDS = 5  # Rounds before a ride is left to the drivers already offered it
+
+# Fares: base + per_km * straight-line km, at least minimum; unknown ride types use AMBULANCE
+RIDE_TARIFFS = {
+    'AMBULANCE': {'base': 300, 'per_km': 25, 'minimum': 400},
+}
+FARE_QUOTE_PRECISION = 3  # Decimal places coordinates are rounded to for memoized quotes (~100 m)
+FARE_QUOTE_CACHE_SIZE = 10000
+FARE_QUOTE_MAX_POINTS = 500  # Pickups one /api/fare-quote/ request may price
+
+RIDE_ARCHIVE_AFTER_DAYS = 30  # Finished rides older than this move to ArchivedRide (`python manage.py archive_rides`)
+
+RIDE_OFFER_CACHE_SIZE = 10000  # Rides whose offered drivers are kept in memory
+RIDE_PAYLOAD_CACHE_SIZE = 2048  # Encoded ride detail payloads kept for websocket and REST reuse
+RIDE_PAYLOAD_CACHE_TTL = 5  # Seconds a cached ride payload is served before it is re-serialized
+
+# Admin dashboard counters (recount periodically with `python manage.py reconcile_counters`)
+DASHBOARD_HOURLY_RETENTION_HOURS = 48
+DASHBOARD_PUSH_INTERVAL = 0.25  # Seconds between coalesced live dashboard pushes
+DRIVER_LOCATION_FLUSH_INTERVAL = 5  # Seconds between database writes of a driver's streamed position
+
+# Live ride tracking pushed to patients
+RIDE_TRACKING_MIN_INTERVAL = 2  # Seconds between pushes for one ride
+RIDE_TRACKING_MIN_DISTANCE_M = 25  # Smaller moves are dropped unless the ETA minute changes
+RIDE_TRACKING_SPEED_KMH = 30  # Average ambulance speed used for the ETA
+RIDE_TRACKING_LOOKUP_TTL = 10  # Seconds a streaming driver's active ride is trusted before it is read again
+
+# Websocket authentication: clients pass their SimpleJWT access token as ?token=
+WS_IDENTITY_CACHE_TTL = 60  # Seconds to cache identities of tokens without user_type claims (0 disables)
+WS_ALLOW_URL_IDENTITY = DEBUG  # Accept token-less connections identified by the URL user_id (development only)
+
+# Reconnect replay: clients reconnect with ?last_seq=<seq of the last frame seen>, an "<origin>:<n>"
+# token numbered per process, so only what the reconnected-to worker published can be replayed
+WS_REPLAY_MAX_MESSAGES = 100  # Recent messages kept per driver/user group
+WS_REPLAY_MAX_AGE = 300  # Seconds a message stays replayable
+WS_REPLAY_TYPES = ('ride_notification', 'ride_cancelled', 'ride_status_update')
+
+# Server-side heartbeat: connections silent for WS_IDLE_TIMEOUT seconds are
+# closed and removed from their groups (clients ping every 30 seconds)
+WS_IDLE_TIMEOUT = 75
+WS_HEARTBEAT_TICK = 5  # Seconds per timer-wheel slot
+WS_CONNECTION_REPORT_INTERVAL = 300  # Seconds between connection count/memory log lines (0 disables)
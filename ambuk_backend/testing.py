@@ -0,0 +1,53 @@
+from contextlib import contextmanager
+from decimal import Decimal
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+@contextmanager
+def assert_max_queries(limit, using=DEFAULT_DB_ALIAS):
+    """Fail if the block runs more than `limit` queries.
+
+    Use it around a view call with a few rows and again with many rows to
+    prove the endpoint's query count does not grow with the row count:
+
+        with assert_max_queries(3):
+            client.get('/api/admin/rides/')
+    """
+    with CaptureQueriesContext(connections[using]) as context:
+        yield context
+
+    executed = len(context.captured_queries)
+    if executed > limit:
+        queries = '\n'.join(f"{i}. {query['sql']}" for i, query in enumerate(context.captured_queries, 1))
+        raise QueryBudgetExceeded(f"{executed} queries executed, budget was {limit}:\n{queries}")
+
+# Plain list, one keyset page and the streamed array
+LISTING_PARAMS = ['', '?limit=500', '?stream=1']
+
+def create_driver(n):
+    """An available driver with a position, for listing tests"""
+    from drivers.models import Driver
+    from users.models import User
+
+    user = User.objects.create(email=f'driver{n}@example.com', username=f'driver{n}', user_type='DRIVER')
+    return Driver.objects.create(user=user, status='AVAILABLE', current_location_lat=Decimal('13.0'),
+                                 current_location_lng=Decimal('77.6'))
+
+def create_rides(count, user, driver=None):
+    """count live rides of the user, with an archived ride beside every other one"""
+    from rides.models import Ride, ArchivedRide
+
+    for n in range(count):
+        fields = dict(user=user, driver=driver, pickup_location='Pickup', pickup_lat=Decimal('13.0'),
+                      pickup_lng=Decimal('77.6'), destination='Hospital', destination_lat=Decimal('13.1'),
+                      destination_lng=Decimal('77.7'), estimated_fare=Decimal('500.00'))
+        if n % 2:
+            ride = Ride.objects.create(status='ACCEPTED' if driver else 'REQUESTED', **fields)
+            ArchivedRide.objects.create(id=ride.id + 100000, status='COMPLETED', ride_type=ride.ride_type,
+                                        created_at=ride.created_at, updated_at=timezone.now(), **fields)
+        else:
+            Ride.objects.create(**fields)
@@ -0,0 +1,217 @@
+import heapq
+import logging
+import math
+import threading
+import time
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance in kilometres between two lat/lng points"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (float(lat1), float(lng1), float(lat2), float(lng2)))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+class DriverLocationIndex:
+    """Uniform lat/lng grid over the positions of available drivers.
+
+    Each cell holds the drivers currently inside it, so a nearest-driver lookup
+    only has to visit the rings of cells around the pickup point instead of the
+    whole fleet.
+
+    The index lives in one process and applies that process's status
+    changes and positions at once. Changes made through other workers only
+    reach it through the database, so load_driver_index() rebuilds it from
+    the AVAILABLE rows once it is `ttl` seconds old (None: load only once).
+    """
+
+    def __init__(self, cell_size_deg=0.01, ttl=5.0):
+        self.cell_size = cell_size_deg
+        self.ttl = ttl
+        self._cells = {}    # (row, col) -> {driver_id: (user_id, lat, lng)}
+        self._drivers = {}  # driver_id -> (row, col)
+        self._lock = threading.Lock()
+        self._loading = threading.Lock()
+        self.loaded_at = None  # monotonic time of the last load from the database
+
+    def __len__(self):
+        return len(self._drivers)
+
+    def __contains__(self, driver_id):
+        return driver_id in self._drivers
+
+    def _cell_for(self, lat, lng):
+        return (math.floor(lat / self.cell_size), math.floor(lng / self.cell_size))
+
+    def _place(self, driver_id, user_id, lat, lng):
+        cell = self._cell_for(lat, lng)
+        old_cell = self._drivers.get(driver_id)
+        if old_cell is not None and old_cell != cell:
+            self._discard(driver_id, old_cell)
+        self._cells.setdefault(cell, {})[driver_id] = (user_id, lat, lng)
+        self._drivers[driver_id] = cell
+
+    def _discard(self, driver_id, cell):
+        members = self._cells.get(cell)
+        if members is not None:
+            members.pop(driver_id, None)
+            if not members:
+                del self._cells[cell]
+
+    def update(self, driver_id, user_id, lat, lng):
+        """Insert or move a driver"""
+        with self._lock:
+            self._place(driver_id, user_id, float(lat), float(lng))
+
+    def move(self, driver_id, lat, lng):
+        """Move a driver that is already indexed; returns False if it is not"""
+        with self._lock:
+            cell = self._drivers.get(driver_id)
+            if cell is None:
+                return False
+            user_id = self._cells[cell][driver_id][0]
+            self._place(driver_id, user_id, float(lat), float(lng))
+            return True
+
+    def remove(self, driver_id):
+        with self._lock:
+            cell = self._drivers.pop(driver_id, None)
+            if cell is not None:
+                self._discard(driver_id, cell)
+
+    def clear(self):
+        with self._lock:
+            self._cells.clear()
+            self._drivers.clear()
+            self.loaded_at = None
+
+    def due_for_load(self, now=None):
+        if self.loaded_at is None:
+            return True
+        now = time.monotonic() if now is None else now
+        return self.ttl is not None and now - self.loaded_at >= self.ttl
+
+    def replace(self, entries, loaded_at=None):
+        """Swap the whole index for (driver_id, user_id, lat, lng) entries"""
+        cells, drivers = {}, {}
+        for driver_id, user_id, lat, lng in entries:
+            lat, lng = float(lat), float(lng)
+            cell = self._cell_for(lat, lng)
+            cells.setdefault(cell, {})[driver_id] = (user_id, lat, lng)
+            drivers[driver_id] = cell
+        with self._lock:
+            self._cells, self._drivers = cells, drivers
+            self.loaded_at = time.monotonic() if loaded_at is None else loaded_at
+
+    def position(self, driver_id):
+        """Return (user_id, lat, lng) for an indexed driver, or None"""
+        with self._lock:
+            cell = self._drivers.get(driver_id)
+            return self._cells[cell][driver_id] if cell is not None else None
+
+    def nearest(self, lat, lng, k=10, radius_km=5.0, exclude=()):
+        """Return up to k (distance_km, driver_id, user_id) tuples within radius_km, closest first"""
+        lat, lng = float(lat), float(lng)
+        row, col = self._cell_for(lat, lng)
+
+        # Smallest cell edge at this latitude bounds how far each ring reaches
+        cell_km = self.cell_size * KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01)
+        max_ring = int(math.ceil(radius_km / cell_km)) + 1
+
+        found = []
+        with self._lock:
+            for ring in range(max_ring + 1):
+                for cell in self._ring_cells(row, col, ring):
+                    for driver_id, (user_id, d_lat, d_lng) in self._cells.get(cell, {}).items():
+                        if driver_id in exclude:
+                            continue
+                        distance = haversine_km(lat, lng, d_lat, d_lng)
+                        if distance <= radius_km:
+                            found.append((distance, driver_id, user_id))
+
+                # Anything in the next ring is at least ring * cell_km away
+                if len(found) >= k and heapq.nsmallest(k, found)[-1][0] <= ring * cell_km:
+                    break
+
+        return heapq.nsmallest(k, found)
+
+    @staticmethod
+    def _ring_cells(row, col, ring):
+        if ring == 0:
+            yield (row, col)
+            return
+        for dc in range(-ring, ring + 1):
+            yield (row - ring, col + dc)
+            yield (row + ring, col + dc)
+        for dr in range(-ring + 1, ring):
+            yield (row + dr, col - ring)
+            yield (row + dr, col + ring)
+
+driver_index = DriverLocationIndex(
+    getattr(settings, 'DISPATCH_GRID_CELL_DEG', 0.01),
+    ttl=getattr(settings, 'DISPATCH_INDEX_TTL', 5.0),
+)
+
+def is_dispatchable(driver):
+    return (driver.status == 'AVAILABLE'
+            and driver.current_location_lat is not None
+            and driver.current_location_lng is not None)
+
+def sync_driver(driver):
+    """Bring the index in line with a driver's current status and position"""
+    if is_dispatchable(driver):
+        driver_index.update(driver.id, driver.user_id, driver.current_location_lat, driver.current_location_lng)
+    else:
+        driver_index.remove(driver.id)
+
+def load_driver_index():
+    """(Re)build the index from the database when it is due; a cheap check otherwise.
+
+    One read of the AVAILABLE drivers through the driver_available_idx
+    partial index. A single thread reloads while the others keep using the
+    current grid; only the very first load makes them wait. Positions
+    streamed to this process are newer than the flushed ones and win.
+    """
+    if not driver_index.due_for_load():
+        return
+    first = driver_index.loaded_at is None
+    if not driver_index._loading.acquire(blocking=first):
+        return
+    try:
+        if not driver_index.due_for_load():
+            return  # Loaded by the thread we waited for
+        from .models import Driver
+        from .positions import position_store
+
+        started = time.monotonic()
+        rows = Driver.objects.filter(
+            status='AVAILABLE',
+            current_location_lat__isnull=False,
+            current_location_lng__isnull=False,
+        ).values_list('id', 'user_id', 'current_location_lat', 'current_location_lng')
+
+        entries = []
+        for driver_id, user_id, lat, lng in rows.iterator():
+            latest = position_store.latest(driver_id)
+            if latest is not None:
+                lat, lng = latest[0], latest[1]
+            entries.append((driver_id, user_id, lat, lng))
+        driver_index.replace(entries, loaded_at=started)
+        if first:
+            logger.info(f"Loaded {len(entries)} available drivers into the dispatch index")
+    finally:
+        driver_index._loading.release()
+
+def find_nearby_drivers(lat, lng, k=None, radius_km=None, exclude=()):
+    """Return (distance_km, driver_id, user_id) for the k nearest available drivers"""
+    load_driver_index()
+    if k is None:
+        k = getattr(settings, 'DISPATCH_MAX_DRIVERS', 20)
+    if radius_km is None:
+        radius_km = getattr(settings, 'DISPATCH_RADIUS_KM', 10)
+    return driver_index.nearest(lat, lng, k=k, radius_km=radius_km, exclude=exclude)
@@ -20,5 +20,15 @@ class Driver(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            # Keyset pagination for the admin driver list
+            models.Index(fields=['-created_at', '-id'], name='driver_created_idx'),
+            models.Index(fields=['status'], name='driver_status_idx'),
+            # Dispatch only ever loads the available drivers
+            models.Index(fields=['id'], name='driver_available_idx',
+                         condition=models.Q(status='AVAILABLE')),
+        ]
+    
     def __str__(self):
         return f"Driver: {self.user.email}"
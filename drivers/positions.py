@@ -0,0 +1,122 @@
+import logging
+import threading
+import time
+from decimal import Decimal
+from django.conf import settings
+from .geo import driver_index
+from .models import Driver
+
+logger = logging.getLogger(__name__)
+
+class PositionStore:
+    """Latest reported driver positions, written back to the database in bulk.
+
+    Reports only touch memory and the dispatch index. Each driver's position
+    reaches the database at most once per flush_interval, and every flush
+    writes all due drivers with a single bulk UPDATE.
+
+    Positions are held by the process whose websocket received them. Other
+    workers' latest() returns None for that driver and they fall back to the
+    last flushed database position, up to flush_interval old.
+    """
+
+    def __init__(self, flush_interval=5.0, tick=1.0):
+        self.flush_interval = flush_interval
+        self.tick = tick
+        self._positions = {}     # driver_id -> (lat, lng, reported_at)
+        self._dirty = set()
+        self._last_written = {}  # driver_id -> monotonic time of last DB write
+        self._last_tick = 0.0
+        self._lock = threading.Lock()
+
+    def report(self, driver_id, lat, lng):
+        """Record a position; returns (lat, lng) as stored"""
+        lat, lng = float(lat), float(lng)
+        with self._lock:
+            self._positions[driver_id] = (lat, lng, time.time())
+            self._dirty.add(driver_id)
+        # Keep dispatch current without waiting for the database write
+        driver_index.move(driver_id, lat, lng)
+        return lat, lng
+
+    def latest(self, driver_id):
+        """Return (lat, lng, reported_at) of the last report, or None"""
+        with self._lock:
+            return self._positions.get(driver_id)
+
+    def flush_due(self):
+        """True at most once per tick, so only one caller runs the periodic flush"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_tick < self.tick or not self._dirty:
+                return False
+            self._last_tick = now
+            return True
+
+    def _take(self, driver_ids=None, force=False):
+        now = time.monotonic()
+        rows = []
+        with self._lock:
+            candidates = self._dirty if driver_ids is None else self._dirty.intersection(driver_ids)
+            for driver_id in list(candidates):
+                if not force and now - self._last_written.get(driver_id, 0.0) < self.flush_interval:
+                    continue
+                lat, lng, _ = self._positions[driver_id]
+                rows.append((driver_id, lat, lng))
+                self._dirty.discard(driver_id)
+                self._last_written[driver_id] = now
+        return rows
+
+    def flush(self, driver_ids=None, force=False):
+        """Write due positions to the database; returns the number of drivers written"""
+        rows = self._take(driver_ids, force)
+        if not rows:
+            return 0
+
+        drivers = [
+            Driver(id=driver_id,
+                   current_location_lat=Decimal(f'{lat:.6f}'),
+                   current_location_lng=Decimal(f'{lng:.6f}'))
+            for driver_id, lat, lng in rows
+        ]
+        try:
+            Driver.objects.bulk_update(drivers, ['current_location_lat', 'current_location_lng'], batch_size=500)
+        except Exception as e:
+            logger.error(f"Failed to write {len(rows)} driver positions: {str(e)}")
+            with self._lock:
+                # Put them back so the next tick retries, unless newer reports arrived
+                for driver_id, _, _ in rows:
+                    self._dirty.add(driver_id)
+                    self._last_written.pop(driver_id, None)
+            return 0
+
+        # bulk_update skips post_save, so index available drivers reporting
+        # their first position here
+        unindexed = {driver_id: (lat, lng) for driver_id, lat, lng in rows if driver_id not in driver_index}
+        if unindexed:
+            available = Driver.objects.filter(id__in=unindexed, status='AVAILABLE').values_list('id', 'user_id')
+            for driver_id, user_id in available:
+                driver_index.update(driver_id, user_id, *unindexed[driver_id])
+
+        from rides.payloads import ride_payloads
+        ride_payloads.invalidate_drivers({driver_id for driver_id, _, _ in rows})
+        logger.debug(f"Wrote positions of {len(rows)} drivers")
+        return len(rows)
+
+    def forget(self, driver_id):
+        with self._lock:
+            self._positions.pop(driver_id, None)
+            self._dirty.discard(driver_id)
+            self._last_written.pop(driver_id, None)
+
+position_store = PositionStore(getattr(settings, 'DRIVER_LOCATION_FLUSH_INTERVAL', 5.0))
+
+def parse_position(data):
+    """Validate a {'lat': ..., 'lng': ...} message, returning floats or None"""
+    try:
+        lat, lng = float(data['lat']), float(data['lng'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return lat, lng
@@ -0,0 +1,12 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Driver
+from .geo import driver_index, sync_driver
+
+@receiver(post_save, sender=Driver)
+def update_driver_index(sender, instance, **kwargs):
+    sync_driver(instance)
+
+@receiver(post_delete, sender=Driver)
+def remove_from_driver_index(sender, instance, **kwargs):
+    driver_index.remove(instance.id)
@@ -1,9 +1,11 @@
 
 from django.urls import path
-from .views import DriverLoginView, DriverProfileView, AcceptRideView
+from .views import DriverLoginView, DriverProfileView, AcceptRideView, PickUpRideView, CompleteRideView
 
 urlpatterns = [
     path('driver/login/', DriverLoginView.as_view(), name='driver-login'),
     path('driver/profile/', DriverProfileView.as_view(), name='driver-profile'),
     path('driver/accept-ride/', AcceptRideView.as_view(), name='driver-accept-ride'),
+    path('driver/rides/<int:ride_id>/pickup/', PickUpRideView.as_view(), name='driver-pickup-ride'),
+    path('driver/rides/<int:ride_id>/complete/', CompleteRideView.as_view(), name='driver-complete-ride'),
 ]
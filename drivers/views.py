@@ -2,19 +2,21 @@
 from rest_framework import status, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework_simplejwt.tokens import RefreshToken
+from users.tokens import tokens_for_user
 from django.contrib.auth import authenticate
 from .serializers import DriverSerializer
 from .models import Driver
-from rides.models import Ride
+from users.ratelimit import LoginRateThrottle, login_succeeded
+from rides.state import accept_ride, pick_up_ride, complete_ride, RideUnavailable, DriverUnavailable
+from rides.payloads import ride_response
 from django.shortcuts import get_object_or_404
-from django.db import transaction
 import logging
 
 logger = logging.getLogger(__name__)
 
 class DriverLoginView(APIView):
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [LoginRateThrottle]
     
     def post(self, request):
         email = request.data.get('email')
@@ -23,9 +25,11 @@ class DriverLoginView(APIView):
         logger.info(f"Driver login attempt for email: {email}")
         
         user = authenticate(username=email, password=password)
+        if user:
+            login_succeeded(email)
         
         if user and user.user_type == 'DRIVER':
-            refresh = RefreshToken.for_user(user)
+            refresh = tokens_for_user(user)
             
             try:
                 driver = user.driver
@@ -81,50 +85,62 @@ class AcceptRideView(APIView):
             return Response({'error': 'Missing ride ID'}, status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            # Use transaction to ensure atomicity
-            with transaction.atomic():
-                driver = Driver.objects.select_for_update().get(user=request.user)
-                ride = Ride.objects.select_for_update().get(id=ride_id, status='REQUESTED')
-                
-                # Update the ride
-                ride.driver = driver
-                ride.status = 'ACCEPTED'
-                ride.save()
-                
-                # Update the driver status
-                driver.status = 'BUSY'
-                driver.save()
-                
-                logger.info(f"Ride {ride_id} accepted by driver {driver.id} successfully")
-            
-            # Get fresh instances after the transaction
-            updated_ride = Ride.objects.get(id=ride_id)
-            
-            # Notify user through WebSockets
-            from ws.utils import send_ride_update
-            notification_sent = send_ride_update(updated_ride)
+            driver = Driver.objects.only('id', 'user_id', 'status').get(user=request.user)
             
-            if not notification_sent:
-                logger.warning(f"Failed to notify user {updated_ride.user.id} about ride acceptance")
+            # Guarded UPDATEs: the first driver wins, the rest fail fast. The
+            # returned ride is already up to date, so there is no re-fetch.
+            updated_ride = accept_ride(ride_id, driver)
             
             # Return detailed response
-            return Response({
-                'message': 'Ride accepted successfully',
-                'ride': RideDetailSerializer(updated_ride).data
-            })
+            return ride_response(updated_ride, message='Ride accepted successfully')
             
         except Driver.DoesNotExist:
             logger.error(f"Driver profile not found for user {request.user.id}")
             return Response({'error': 'Driver profile not found'}, status=status.HTTP_404_NOT_FOUND)
-        except Ride.DoesNotExist:
+        except RideUnavailable:
             logger.warning(f"Ride {ride_id} not found or already accepted")
             return Response({
                 'error': 'Ride not found or already accepted',
                 'code': 'RIDE_UNAVAILABLE'
             }, status=status.HTTP_404_NOT_FOUND)
+        except DriverUnavailable:
+            logger.warning(f"Driver {driver.id} changed status while accepting ride {ride_id}")
+            return Response({
+                'error': 'Driver status changed, please retry',
+                'code': 'DRIVER_UNAVAILABLE'
+            }, status=status.HTTP_409_CONFLICT)
         except Exception as e:
             logger.error(f"Error accepting ride: {str(e)}", exc_info=True)
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-# Import at the top
-from rides.serializers import RideDetailSerializer
+
+class RideProgressView(APIView):
+    """Moves the driver's assigned ride on to the next status"""
+    transition = None
+    done_message = None
+    
+    def post(self, request, ride_id):
+        try:
+            driver = Driver.objects.only('id', 'user_id', 'status').get(user=request.user)
+            ride = self.transition(ride_id, driver)
+            return ride_response(ride, message=self.done_message)
+        except Driver.DoesNotExist:
+            logger.error(f"Driver profile not found for user {request.user.id}")
+            return Response({'error': 'Driver profile not found'}, status=status.HTTP_404_NOT_FOUND)
+        except RideUnavailable:
+            logger.warning(f"Driver {request.user.id} cannot move ride {ride_id} on from its current status")
+            return Response({
+                'error': 'Ride not found, not assigned to you or not in the required status',
+                'code': 'RIDE_UNAVAILABLE'
+            }, status=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            logger.error(f"Error updating ride {ride_id}: {str(e)}", exc_info=True)
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+class PickUpRideView(RideProgressView):
+    transition = staticmethod(pick_up_ride)
+    done_message = 'Patient picked up'
+
+class CompleteRideView(RideProgressView):
+    transition = staticmethod(complete_ride)
+    done_message = 'Ride completed'
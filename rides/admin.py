@@ -1,6 +1,6 @@
 
 from django.contrib import admin
-from .models import Ride
+from .models import Ride, ArchivedRide, RideOffer
 
 @admin.register(Ride)
 class RideAdmin(admin.ModelAdmin):
@@ -8,3 +8,17 @@ class RideAdmin(admin.ModelAdmin):
     list_filter = ['status', 'created_at']
     search_fields = ['user__email', 'driver__user__email', 'pickup_location', 'destination']
     ordering = ['-created_at']
+
+@admin.register(ArchivedRide)
+class ArchivedRideAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'driver', 'pickup_location', 'destination', 'status', 'created_at', 'archived_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['user__email', 'driver__user__email', 'pickup_location', 'destination']
+    ordering = ['-created_at']
+
+@admin.register(RideOffer)
+class RideOfferAdmin(admin.ModelAdmin):
+    list_display = ['ride', 'driver', 'offered_at', 'accepted_at']
+    list_filter = ['offered_at']
+    search_fields = ['driver__user__email']
+    ordering = ['-offered_at']
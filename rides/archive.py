@@ -0,0 +1,65 @@
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import router, transaction
+from django.utils import timezone
+from ambuk_backend.pagination import MergedListing
+from .models import Ride, ArchivedRide, RideOffer
+from .payloads import ride_payloads
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED_STATUSES = ('COMPLETED', 'CANCELLED')
+
+ARCHIVED_FIELDS = [field.attname for field in ArchivedRide._meta.concrete_fields if field.name != 'archived_at']
+
+def archive_rides(older_than=None, batch_size=1000, limit=None):
+    """Move finished rides last updated before `older_than` to ArchivedRide; returns how many.
+
+    Works in batches of batch_size rides, each copied and deleted in one
+    transaction, so the Ride table is never locked for long and an
+    interrupted run loses nothing. The rides' offers are dropped with them.
+    Ride ids are never reused (AUTOINCREMENT on SQLite, sequences on
+    PostgreSQL), so an id already in the archive means something else wrote
+    there: the batch fails with IntegrityError and rolls back rather than
+    deleting a ride whose copy was skipped.
+    """
+    if older_than is None:
+        older_than = timezone.now() - timedelta(days=getattr(settings, 'RIDE_ARCHIVE_AFTER_DAYS', 30))
+    candidates = Ride.objects.filter(status__in=ARCHIVED_STATUSES, updated_at__lt=older_than).order_by('id')
+
+    moved = 0
+    while limit is None or moved < limit:
+        size = batch_size if limit is None else min(batch_size, limit - moved)
+        with transaction.atomic():
+            rows = list(candidates.values(*ARCHIVED_FIELDS)[:size])
+            if not rows:
+                break
+            ids = [row['id'] for row in rows]
+            ArchivedRide.objects.bulk_create([ArchivedRide(**row) for row in rows])
+            RideOffer.objects.filter(ride_id__in=ids).delete()
+            delete_archived(ids)
+        for ride_id in ids:
+            ride_payloads.invalidate(ride_id)
+        moved += len(ids)
+        logger.info(f"Archived {moved} rides so far (up to ride {ids[-1]})")
+    return moved
+
+def delete_archived(ids):
+    """Delete rides already copied to ArchivedRide, without the model signals.
+
+    The only place rides are deleted this way: an archived ride still counts
+    towards the dashboard totals (see adminpanel.counters.reconcile), so the
+    post_delete receivers must not count it as gone. Nothing cascades either;
+    callers delete the rides' offers first, and a row still referencing one
+    of the rides fails the transaction on its foreign key.
+    """
+    Ride.objects.filter(id__in=ids)._raw_delete(router.db_for_write(Ride))
+
+def ride_history(user=None):
+    """Live and archived rides, optionally of one user, as one listing for list_response"""
+    live = Ride.objects.with_details()
+    archived = ArchivedRide.objects.with_details()
+    if user is not None:
+        live, archived = live.filter(user=user), archived.filter(user=user)
+    return MergedListing(live, archived)
@@ -0,0 +1,97 @@
+import math
+import threading
+from collections import OrderedDict
+from decimal import Decimal, ROUND_HALF_UP
+from django.conf import settings
+from drivers.geo import haversine_km, EARTH_RADIUS_KM
+
+try:
+    import numpy as np
+except ImportError:  # Optional: batch quotes fall back to one haversine per point
+    np = None
+
+DEFAULT_TARIFFS = {
+    'AMBULANCE': {'base': 300, 'per_km': 25, 'minimum': 400},
+}
+
+CENTS = Decimal('0.01')
+
+def distances_km(pickups, destinations):
+    """Haversine km between each pickup (lat, lng) and the destination at the same position"""
+    if np is None:
+        return [haversine_km(p_lat, p_lng, d_lat, d_lng)
+                for (p_lat, p_lng), (d_lat, d_lng) in zip(pickups, destinations)]
+    start = np.radians(np.asarray(pickups, dtype=float).reshape(-1, 2))
+    end = np.radians(np.asarray(destinations, dtype=float).reshape(-1, 2))
+    lat1, lng1, lat2, lng2 = start[:, 0], start[:, 1], end[:, 0], end[:, 1]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return (2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))).tolist()
+
+class FareEngine:
+    """Prices rides from the straight-line distance and the ride type's tariff.
+
+    A tariff is {'base', 'per_km', 'minimum'}; ride types without one use
+    default_type's. Quotes are memoized per ride type and pickup/destination
+    rounded to `precision` decimal places (3 is about 100 m), so repeated
+    quotes for nearby points and the booking that follows a quote are
+    dictionary lookups.
+    """
+
+    def __init__(self, tariffs=None, default_type='AMBULANCE', precision=3, max_entries=10000):
+        self.tariffs = {key.upper(): value for key, value in (tariffs or DEFAULT_TARIFFS).items()}
+        self.default_type = default_type.upper()
+        self.precision = precision
+        self.max_entries = max_entries
+        self._quotes = OrderedDict()  # (ride_type, p_lat, p_lng, d_lat, d_lng) -> (distance_km, fare)
+        self._lock = threading.Lock()
+
+    def tariff_type(self, ride_type):
+        ride_type = (ride_type or self.default_type).upper()
+        return ride_type if ride_type in self.tariffs else self.default_type
+
+    def price(self, ride_type, distance_km):
+        tariff = self.tariffs[self.tariff_type(ride_type)]
+        fare = max(tariff['base'] + tariff['per_km'] * distance_km, tariff['minimum'])
+        return Decimal(str(fare)).quantize(CENTS, rounding=ROUND_HALF_UP)
+
+    def _key(self, ride_type, pickup, destination):
+        digits = self.precision
+        return (ride_type, round(float(pickup[0]), digits), round(float(pickup[1]), digits),
+                round(float(destination[0]), digits), round(float(destination[1]), digits))
+
+    def quote_many(self, pickups, destination, ride_type=None):
+        """Return (distance_km, fare) for each pickup (lat, lng) to one destination"""
+        ride_type = self.tariff_type(ride_type)
+        keys = [self._key(ride_type, pickup, destination) for pickup in pickups]
+        quotes = []
+        with self._lock:
+            for key in keys:
+                quote = self._quotes.get(key)
+                if quote is not None:
+                    self._quotes.move_to_end(key)
+                quotes.append(quote)
+
+        missing = [i for i, quote in enumerate(quotes) if quote is None]
+        if missing:
+            # Priced from the rounded points, so every caller sharing a key gets the same fare
+            distances = distances_km([keys[i][1:3] for i in missing], [keys[i][3:5] for i in missing])
+            with self._lock:
+                for i, distance in zip(missing, distances):
+                    quotes[i] = (round(distance, 2), self.price(ride_type, distance))
+                    self._quotes[keys[i]] = quotes[i]
+                while len(self._quotes) > self.max_entries:
+                    self._quotes.popitem(last=False)
+        return quotes
+
+    def quote(self, pickup_lat, pickup_lng, destination_lat, destination_lng, ride_type=None):
+        """Return (distance_km, fare) for one ride"""
+        return self.quote_many([(pickup_lat, pickup_lng)], (destination_lat, destination_lng), ride_type)[0]
+
+def valid_point(lat, lng):
+    return math.isfinite(lat) and math.isfinite(lng) and -90 <= lat <= 90 and -180 <= lng <= 180
+
+fare_engine = FareEngine(
+    tariffs=getattr(settings, 'RIDE_TARIFFS', None),
+    precision=getattr(settings, 'FARE_QUOTE_PRECISION', 3),
+    max_entries=getattr(settings, 'FARE_QUOTE_CACHE_SIZE', 10000),
+)
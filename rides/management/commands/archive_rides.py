@@ -0,0 +1,21 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rides.archive import archive_rides
+
+class Command(BaseCommand):
+    help = 'Move completed and cancelled rides older than RIDE_ARCHIVE_AFTER_DAYS to the archive table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, default=getattr(settings, 'RIDE_ARCHIVE_AFTER_DAYS', 30),
+                            help='Archive finished rides last updated more than DAYS ago')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--limit', type=int, default=None, help='Archive at most LIMIT rides this run')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        moved = archive_rides(timezone.now() - timedelta(days=options['days']),
+                              batch_size=options['batch_size'], limit=options['limit'])
+        self.stdout.write(f"Archived {moved} rides in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,106 @@
+import threading
+import time
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from drivers.models import Driver
+from rides.state import accept_ride, pick_up_ride, complete_ride, RideUnavailable, DriverUnavailable
+from rides.models import Ride
+from users.models import User
+
+BENCH_DOMAIN = 'bench-acceptance.local'
+
+def accept_with_locks(ride_id, driver):
+    """The previous acceptance path: row locks and full-row saves, for comparison"""
+    with transaction.atomic():
+        driver = Driver.objects.select_for_update().get(id=driver.id)
+        try:
+            ride = Ride.objects.select_for_update().get(id=ride_id, status='REQUESTED')
+        except Ride.DoesNotExist:
+            raise RideUnavailable(ride_id)
+        ride.driver = driver
+        ride.status = 'ACCEPTED'
+        ride.save()
+        driver.status = 'BUSY'
+        driver.save()
+
+class Command(BaseCommand):
+    help = 'Benchmark N drivers racing to accept M rides, with conditional UPDATEs or the old row-locking path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drivers', type=int, default=8, help='Drivers racing, one thread each')
+        parser.add_argument('--rides', type=int, default=200, help='Rides to accept')
+        parser.add_argument('--mode', choices=['cas', 'locking'], default='cas')
+
+    def handle(self, *args, **options):
+        self.cleanup()
+        drivers, ride_ids = self.setup(options['drivers'], options['rides'])
+        accept = accept_ride if options['mode'] == 'cas' else accept_with_locks
+        outcomes = {'won': 0, 'lost': 0, 'errors': 0}
+        lock = threading.Lock()
+        latencies = []
+        barrier = threading.Barrier(len(drivers))
+
+        def race(driver):
+            driver = Driver.objects.only('id', 'user_id', 'status').get(id=driver.id)
+            barrier.wait()
+            for ride_id in ride_ids:
+                start = time.perf_counter()
+                try:
+                    accept(ride_id, driver)
+                    outcome = 'won'
+                except (RideUnavailable, DriverUnavailable):
+                    outcome = 'lost'
+                except Exception:
+                    outcome = 'errors'
+                elapsed = time.perf_counter() - start
+                with lock:
+                    outcomes[outcome] += 1
+                    latencies.append(elapsed)
+                if outcome == 'won':
+                    # Untimed: finish the ride so the driver is AVAILABLE to race again
+                    pick_up_ride(ride_id, driver)
+                    complete_ride(ride_id, driver)
+            connection.close()
+
+        threads = [threading.Thread(target=race, args=(driver,)) for driver in drivers]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        accepted = Ride.objects.filter(id__in=ride_ids, driver__isnull=False).count()
+        latencies.sort()
+        attempts = len(latencies)
+        self.stdout.write(
+            f"{options['mode']}: {options['drivers']} drivers x {options['rides']} rides in {elapsed:.3f}s "
+            f"({attempts / elapsed:.0f} attempts/s, {accepted / elapsed:.0f} acceptances/s)"
+        )
+        self.stdout.write(
+            f"won {outcomes['won']}, lost {outcomes['lost']}, errors {outcomes['errors']}; "
+            f"{accepted}/{len(ride_ids)} rides accepted; attempt latency "
+            f"p50 {latencies[attempts // 2] * 1000:.2f}ms p99 {latencies[int(attempts * 0.99)] * 1000:.2f}ms"
+        )
+        self.cleanup()
+
+    def setup(self, driver_count, ride_count):
+        patient = User.objects.create_user(
+            email=f'patient@{BENCH_DOMAIN}', username=f'patient@{BENCH_DOMAIN}', user_type='USER')
+        drivers = []
+        for i in range(driver_count):
+            user = User.objects.create_user(
+                email=f'driver{i}@{BENCH_DOMAIN}', username=f'driver{i}@{BENCH_DOMAIN}', user_type='DRIVER')
+            drivers.append(Driver.objects.create(user=user, status='AVAILABLE'))
+        point = Decimal('12.971600')
+        # Created one by one so the dashboard counters stay in step
+        rides = [
+            Ride.objects.create(user=patient, pickup_location='Bench pickup', pickup_lat=point, pickup_lng=point,
+                                destination='Bench destination', destination_lat=point, destination_lng=point)
+            for _ in range(ride_count)
+        ]
+        return drivers, [ride.id for ride in rides]
+
+    def cleanup(self):
+        User.objects.filter(email__endswith=f'@{BENCH_DOMAIN}').delete()
@@ -0,0 +1,98 @@
+import os
+import threading
+import time
+from types import SimpleNamespace
+from django.core.management.base import BaseCommand
+from django.db import connection, OperationalError
+from drivers.models import Driver
+from rides.models import Ride
+from rides.serializers import RideCreateSerializer
+from rides.state import accept_ride, pick_up_ride, complete_ride
+from users.models import User
+
+BENCH_DOMAIN = 'bench-booking.local'
+
+BOOKING = {
+    'pickup_location': 'Bench pickup', 'pickup_lat': '12.971600', 'pickup_lng': '77.594600',
+    'destination': 'Bench destination', 'destination_lat': '12.990000', 'destination_lng': '77.610000',
+}
+
+class Command(BaseCommand):
+    help = 'Benchmark concurrent ride booking, acceptance and completion writes with listing reads on the configured database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8, help='Threads that book, accept and complete rides')
+        parser.add_argument('--bookings', type=int, default=100, help='Rides each writer books')
+        parser.add_argument('--readers', type=int, default=4, help='Threads listing ride history meanwhile')
+
+    def handle(self, *args, **options):
+        self.cleanup()
+        writers = []
+        for i in range(options['writers']):
+            patient = User.objects.create_user(
+                email=f'patient{i}@{BENCH_DOMAIN}', username=f'patient{i}@{BENCH_DOMAIN}', user_type='USER')
+            user = User.objects.create_user(
+                email=f'driver{i}@{BENCH_DOMAIN}', username=f'driver{i}@{BENCH_DOMAIN}', user_type='DRIVER')
+            writers.append((patient, Driver.objects.create(user=user, status='AVAILABLE')))
+        connection.close()
+
+        lock = threading.Lock()
+        latencies, errors, reads = [], [], [0]
+        done = threading.Event()
+
+        def write(patient, driver):
+            request = SimpleNamespace(user=patient)
+            for _ in range(options['bookings']):
+                start = time.perf_counter()
+                try:
+                    serializer = RideCreateSerializer(data=BOOKING, context={'request': request})
+                    serializer.is_valid(raise_exception=True)
+                    ride = serializer.save()
+                    accept_ride(ride.id, driver)
+                    pick_up_ride(ride.id, driver)
+                    complete_ride(ride.id, driver)
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        latencies.append(elapsed)
+                except OperationalError as e:  # e.g. "database is locked"
+                    with lock:
+                        errors.append(str(e))
+            connection.close()
+
+        def read(patient):
+            while not done.is_set():
+                list(Ride.objects.with_details().filter(user=patient).order_by('-created_at', '-id')[:20])
+                with lock:
+                    reads[0] += 1
+            connection.close()
+
+        threads = [threading.Thread(target=write, args=pair) for pair in writers]
+        readers = [threading.Thread(target=read, args=(writers[i % len(writers)][0],)) for i in range(options['readers'])]
+        start = time.perf_counter()
+        for thread in threads + readers:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        done.set()
+        for thread in readers:
+            thread.join()
+
+        latencies.sort()
+        booked = len(latencies)
+        profile = os.environ.get('DATABASE_PROFILE', 'sqlite-wal')
+        self.stdout.write(
+            f"{profile} ({connection.vendor}): {booked} rides booked, accepted and completed by {options['writers']} writers "
+            f"in {elapsed:.2f}s ({booked / elapsed:.0f}/s), {reads[0] / elapsed:.0f} listings/s by "
+            f"{options['readers']} readers"
+        )
+        if latencies:
+            self.stdout.write(
+                f"write latency p50 {latencies[booked // 2] * 1000:.1f}ms "
+                f"p99 {latencies[int(booked * 0.99)] * 1000:.1f}ms, {len(errors)} errors"
+                + (f" (first: {errors[0]})" if errors else "")
+            )
+        self.cleanup()
+
+    def cleanup(self):
+        User.objects.filter(email__endswith=f'@{BENCH_DOMAIN}').delete()
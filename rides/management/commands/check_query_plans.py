@@ -0,0 +1,142 @@
+import re
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from drivers.models import Driver
+from rides.models import Ride, ArchivedRide, RideOffer
+from users.models import User
+from ws.tracking import TRACKED_STATUSES
+
+BENCH_DOMAIN = 'bench-plans.local'
+
+# Plan fragments that mean a table is read in full or sorted row by row
+FULL_SCANS = {
+    'sqlite': [r'\bSCAN (\w+)(?! USING)(?:\s|$)', r'USE TEMP B-TREE FOR ORDER BY'],
+    'postgresql': [r'Seq Scan on (\w+)', r'\bSort\b'],
+}
+
+# Seeded share of rides per status; the in-flight ones are a small minority
+RIDE_STATUS_MIX = [('COMPLETED', 0.88), ('CANCELLED', 0.09), ('REQUESTED', 0.01),
+                   ('ACCEPTED', 0.01), ('PICKED_UP', 0.01)]
+
+def hot_queries(user_id):
+    """(label, queryset) for the queries dispatch, acceptance and the ride lists run constantly"""
+    since = timezone.now() - timedelta(minutes=5)
+    return [
+        ('dispatch index load', Driver.objects.filter(
+            status='AVAILABLE', current_location_lat__isnull=False, current_location_lng__isnull=False,
+        ).values_list('id', 'user_id', 'current_location_lat', 'current_location_lng')),
+        ('acceptance', Ride.objects.filter(id=1, status='REQUESTED')),
+        ('re-dispatch rehydration', Ride.objects.filter(status='REQUESTED', created_at__gte=since).values_list('id', 'created_at')),
+        ('live tracking lookup', Ride.objects.filter(driver_id=1, status__in=TRACKED_STATUSES).only('id', 'driver_id')),
+        ('user ride history', Ride.objects.filter(user_id=user_id).order_by('-created_at', '-pk')[:20]),
+        ('admin ride list', Ride.objects.order_by('-created_at', '-pk')[:20]),
+        ('pending rides', Ride.objects.filter(status='REQUESTED').values_list('id', flat=True)),
+    ]
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the hot ride and driver queries and fail if any reads a table in full'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed-rides', type=int, default=0,
+                            help='Seed this many synthetic rides first (removed afterwards), e.g. 1000000')
+        parser.add_argument('--seed-drivers', type=int, default=2000)
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded rows for another run')
+
+    def handle(self, *args, **options):
+        patterns = FULL_SCANS.get(connection.vendor)
+        if patterns is None:
+            raise CommandError(f"Query plans can only be checked on {' or '.join(FULL_SCANS)}, not {connection.vendor}")
+
+        if options['seed_rides']:
+            self.seed(options['seed_rides'], options['seed_drivers'])
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            user = User.objects.filter(email__endswith=f'@{BENCH_DOMAIN}', user_type='USER').first() or User.objects.first()
+            failures = []
+            for label, queryset in hot_queries(user.id if user else 0):
+                plan = queryset.explain()
+                scans = [match.group(0) for pattern in patterns for match in re.finditer(pattern, plan)]
+                self.stdout.write(f"{'FULL SCAN' if scans else 'ok':>9}  {label}")
+                for line in plan.splitlines():
+                    self.stdout.write(f"           {line}")
+                if scans:
+                    failures.append(label)
+        finally:
+            if options['seed_rides'] and not options['keep']:
+                self.cleanup()
+
+        if failures:
+            raise CommandError(f"Full scans in: {', '.join(failures)}")
+        self.stdout.write(self.style.SUCCESS('All hot queries use indexes'))
+
+    def seed(self, ride_count, driver_count, batch_size=5000):
+        """Bulk insert synthetic users, drivers and rides.
+
+        bulk_create skips the model signals and cleanup() deletes without
+        them, so the dashboard counters never see these rows.
+        """
+        self.cleanup()
+        start = time.perf_counter()
+        patients = User.objects.bulk_create([
+            User(email=f'patient{i}@{BENCH_DOMAIN}', username=f'patient{i}@{BENCH_DOMAIN}', user_type='USER')
+            for i in range(max(ride_count // 50, 1))
+        ], batch_size=batch_size)
+        driver_users = User.objects.bulk_create([
+            User(email=f'driver{i}@{BENCH_DOMAIN}', username=f'driver{i}@{BENCH_DOMAIN}', user_type='DRIVER')
+            for i in range(driver_count)
+        ], batch_size=batch_size)
+        if patients[0].pk is None:  # Backends that do not return ids from bulk inserts
+            patients = list(User.objects.filter(email__startswith='patient', email__endswith=f'@{BENCH_DOMAIN}'))
+            driver_users = list(User.objects.filter(email__startswith='driver', email__endswith=f'@{BENCH_DOMAIN}'))
+
+        # One driver in twenty is available, as at a busy hour
+        Driver.objects.bulk_create([
+            Driver(user=user, status='AVAILABLE' if i % 20 == 0 else ('BUSY' if i % 2 else 'OFFLINE'),
+                   current_location_lat=12.9 + (i % 100) / 500, current_location_lng=77.5 + (i // 100 % 100) / 500)
+            for i, user in enumerate(driver_users)
+        ], batch_size=batch_size)
+        driver_ids = list(Driver.objects.filter(user__email__endswith=f'@{BENCH_DOMAIN}').values_list('id', flat=True))
+
+        statuses = []
+        for status, share in RIDE_STATUS_MIX:
+            statuses += [status] * round(share * 1000)
+        now = timezone.now()
+        for offset in range(0, ride_count, batch_size):
+            rides = []
+            for i in range(offset, min(offset + batch_size, ride_count)):
+                status = statuses[i * 7919 % len(statuses)]
+                rides.append(Ride(
+                    user=patients[i % len(patients)],
+                    driver_id=None if status in ('REQUESTED', 'CANCELLED') else driver_ids[i % len(driver_ids)],
+                    pickup_location='Bench pickup', pickup_lat=12.97, pickup_lng=77.59,
+                    destination='Bench destination', destination_lat=13.0, destination_lng=77.6,
+                    status=status,
+                ))
+            rides = Ride.objects.bulk_create(rides)
+            # auto_now_add stamped every ride with the same time; spread them out instead
+            for i, ride in enumerate(rides, offset):
+                ride.created_at = now - timedelta(minutes=ride_count - i)
+            Ride.objects.bulk_update(rides, ['created_at'], batch_size=1000)
+        self.stdout.write(f"Seeded {ride_count} rides and {driver_count} drivers in {time.perf_counter() - start:.1f}s")
+
+    def cleanup(self):
+        """Delete the seeded rows in plain SQL.
+
+        queryset.delete() would load every ride to run its post_delete
+        receivers, and take the dashboard counters down for rows they never
+        counted.
+        """
+        table = lambda model: connection.ops.quote_name(model._meta.db_table)
+        users = f"SELECT id FROM {table(User)} WHERE email LIKE %s"
+        rides = f"SELECT id FROM {table(Ride)} WHERE user_id IN ({users})"
+        pattern = [f'%@{BENCH_DOMAIN}']
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {table(RideOffer)} WHERE ride_id IN ({rides})", pattern)
+            cursor.execute(f"DELETE FROM {table(Ride)} WHERE user_id IN ({users})", pattern)
+            cursor.execute(f"DELETE FROM {table(ArchivedRide)} WHERE user_id IN ({users})", pattern)
+            cursor.execute(f"DELETE FROM {table(Driver)} WHERE user_id IN ({users})", pattern)
+            cursor.execute(f"DELETE FROM {table(User)} WHERE email LIKE %s", pattern)
@@ -0,0 +1,106 @@
+import math
+import random
+import time
+from types import SimpleNamespace
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from drivers.geo import DriverLocationIndex, KM_PER_DEGREE
+from rides.matching import RideMatcher, STRATEGIES
+
+CENTER = (12.9716, 77.5946)
+
+def random_point(rng, radius_km, center=CENTER):
+    """Uniform point in a disc of radius_km around center"""
+    distance = radius_km * math.sqrt(rng.random())
+    angle = rng.random() * 2 * math.pi
+    lat = center[0] + distance * math.cos(angle) / KM_PER_DEGREE
+    lng = center[1] + distance * math.sin(angle) / (KM_PER_DEGREE * math.cos(math.radians(center[0])))
+    return lat, lng
+
+class Command(BaseCommand):
+    help = 'Simulate surge dispatch on synthetic drivers and rides: broadcast vs batched greedy and optimal matching'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drivers', type=int, default=300)
+        parser.add_argument('--rides-per-window', type=int, default=40)
+        parser.add_argument('--windows', type=int, default=30)
+        parser.add_argument('--city-radius-km', type=float, default=8)
+        parser.add_argument('--hotspot-share', type=float, default=0.5,
+                            help='Share of rides requested around one surge hotspot')
+        parser.add_argument('--trip-windows', type=int, default=10,
+                            help='Windows a driver stays busy after being assigned')
+        parser.add_argument('--seed', type=int, default=7)
+
+    def handle(self, *args, **options):
+        max_km = getattr(settings, 'DISPATCH_RADIUS_KM', 10)
+        fanout = getattr(settings, 'DISPATCH_MAX_DRIVERS', 20)
+        self.stdout.write(
+            f"{options['drivers']} drivers, {options['rides_per_window']} rides per window for "
+            f"{options['windows']} windows, pickup radius {max_km} km"
+        )
+        for strategy in ['broadcast'] + list(STRATEGIES):
+            stats = self.simulate(strategy, options, max_km, fanout)
+            pickups = sorted(stats['pickups'])
+            matched = len(pickups)
+            self.stdout.write(
+                f"{strategy:>9}: matched {matched}/{stats['rides']}, "
+                f"pickup km total {sum(pickups):.0f} mean {sum(pickups) / max(matched, 1):.2f} "
+                f"p90 {pickups[int(matched * 0.9)] if pickups else 0:.2f}, "
+                f"notifications {stats['notifications']}, "
+                f"solve {stats['solve'] * 1000 / options['windows']:.1f} ms/window"
+            )
+
+    def simulate(self, strategy, options, max_km, fanout):
+        # The same seed gives every strategy the same fleet and the same requests
+        rng = random.Random(options['seed'])
+        index = DriverLocationIndex(getattr(settings, 'DISPATCH_GRID_CELL_DEG', 0.01))
+        for driver_id in range(1, options['drivers'] + 1):
+            index.update(driver_id, driver_id, *random_point(rng, options['city_radius_km']))
+        hotspot = random_point(rng, options['city_radius_km'] / 2)
+
+        matcher = RideMatcher(strategy=strategy if strategy in STRATEGIES else 'greedy', max_km=max_km,
+                              candidates_per_ride=10, index=index)
+        returning = {}  # window -> [(driver_id, lat, lng)]
+        stats = {'rides': 0, 'pickups': [], 'notifications': 0, 'solve': 0.0}
+        ride_ids = iter(range(1, 10 ** 9))
+
+        for window in range(options['windows']):
+            for driver_id, lat, lng in returning.pop(window, []):
+                index.update(driver_id, driver_id, lat, lng)
+
+            rides = []
+            for _ in range(options['rides_per_window']):
+                if rng.random() < options['hotspot_share']:
+                    point = random_point(rng, 1.5, hotspot)
+                else:
+                    point = random_point(rng, options['city_radius_km'])
+                rides.append(SimpleNamespace(id=next(ride_ids), pickup_lat=point[0], pickup_lng=point[1]))
+            stats['rides'] += len(rides)
+            # Decided up front so every strategy sees the same click order and drop-offs
+            draws = [(rng.random(), random_point(rng, options['city_radius_km'])) for _ in rides]
+
+            start = time.perf_counter()
+            if strategy == 'broadcast':
+                assignments = []
+                for ride, (click, dropoff) in zip(rides, draws):
+                    notified = index.nearest(ride.pickup_lat, ride.pickup_lng, k=fanout, radius_km=max_km)
+                    stats['notifications'] += len(notified)
+                    if notified:
+                        # First driver to click wins, wherever they are
+                        distance, driver_id, _ = notified[int(click * len(notified))]
+                        index.remove(driver_id)
+                        assignments.append((driver_id, distance, dropoff))
+            else:
+                matches, _ = matcher.match(rides)
+                by_ride = {ride.id: draw for ride, draw in zip(rides, draws)}
+                assignments = []
+                for ride, driver_id, _, distance in matches:
+                    index.remove(driver_id)
+                    assignments.append((driver_id, distance, by_ride[ride.id][1]))
+                stats['notifications'] += len(matches)
+            stats['solve'] += time.perf_counter() - start
+
+            for driver_id, distance, dropoff in assignments:
+                stats['pickups'].append(distance)
+                returning.setdefault(window + options['trip_windows'], []).append((driver_id, *dropoff))
+        return stats
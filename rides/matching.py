@@ -0,0 +1,257 @@
+import logging
+import math
+import threading
+import time
+from django.conf import settings
+from django.db import close_old_connections
+from drivers.geo import driver_index, haversine_km, load_driver_index, EARTH_RADIUS_KM
+from ws.utils import offer_ride, notify_available_drivers
+from .models import Ride
+from .redispatch import redispatcher
+
+try:
+    import numpy as np
+except ImportError:  # Optional: matching falls back to pure-Python greedy assignment
+    np = None
+
+logger = logging.getLogger(__name__)
+
+def distance_matrix(ride_points, driver_points):
+    """Haversine distances in km, one row per ride and one column per driver"""
+    if np is None:
+        return [[haversine_km(r_lat, r_lng, d_lat, d_lng) for d_lat, d_lng in driver_points]
+                for r_lat, r_lng in ride_points]
+    rides = np.radians(np.asarray(ride_points, dtype=float).reshape(-1, 2))
+    drivers = np.radians(np.asarray(driver_points, dtype=float).reshape(-1, 2))
+    lat1, lng1 = rides[:, :1], rides[:, 1:]
+    lat2, lng2 = drivers[:, 0], drivers[:, 1]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def greedy_assignment(matrix, max_km):
+    """Repeatedly pair the closest unassigned ride and driver; returns (ride, driver) index pairs"""
+    if np is None:
+        pairs = sorted((distance, i, j) for i, row in enumerate(matrix)
+                       for j, distance in enumerate(row) if distance <= max_km)
+    else:
+        matrix = np.asarray(matrix)
+        rows, cols = np.nonzero(matrix <= max_km)
+        order = np.argsort(matrix[rows, cols], kind='stable')
+        pairs = zip(matrix[rows, cols][order], rows[order].tolist(), cols[order].tolist())
+
+    assigned, used_rides, used_drivers = [], set(), set()
+    for _, i, j in pairs:
+        if i in used_rides or j in used_drivers:
+            continue
+        assigned.append((i, j))
+        used_rides.add(i)
+        used_drivers.add(j)
+    return assigned
+
+def optimal_assignment(matrix, max_km):
+    """Minimum total pickup distance assignment (Hungarian method, vectorized per row).
+
+    Pairs further apart than max_km are never returned. Needs NumPy and
+    falls back to greedy_assignment without it.
+    """
+    if np is None:
+        return greedy_assignment(matrix, max_km)
+    cost = np.asarray(matrix, dtype=float)
+    if cost.size == 0:
+        return []
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    # Out-of-range pairs get a cost no in-range assignment can beat
+    penalty = (max_km + 1) * (cost.shape[0] + 1)
+    cost = np.where(cost <= max_km, cost, penalty)
+
+    n, m = cost.shape
+    u, v = np.zeros(n + 1), np.zeros(m + 1)
+    match = np.zeros(m + 1, dtype=int)  # column -> row (1-based, 0 = free)
+    way = np.zeros(m + 1, dtype=int)
+    for i in range(1, n + 1):
+        match[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = match[j0]
+            free = ~used[1:]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = j0
+            j1 = int(np.argmin(np.where(free, minv[1:], np.inf))) + 1
+            delta = minv[j1]
+            u[match[used]] += delta
+            v[used] -= delta
+            minv[~used] -= delta
+            j0 = j1
+            if match[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            match[j0] = match[j1]
+            j0 = j1
+
+    pairs = [(int(match[j]) - 1, j - 1) for j in range(1, m + 1) if match[j]]
+    if transposed:
+        pairs = [(j, i) for i, j in pairs]
+    return sorted((i, j) for i, j in pairs if matrix[i][j] <= max_km)
+
+STRATEGIES = {
+    'greedy': greedy_assignment,
+    'optimal': optimal_assignment,
+}
+
+class RideMatcher:
+    """Assigns ride requests to drivers in batches instead of broadcasting them.
+
+    Rides booked within one window are matched together against the nearby
+    available drivers, and each ride is offered to the single driver the
+    assignment picked. Offered drivers are held back from later windows
+    until the ride moves on or offer_timeout passes. A ride left unmatched
+    for max_windows windows falls back to the broadcast dispatch.
+
+    Windows are flushed by one long-lived thread per process, started with
+    the first submitted ride, since matching reads the database.
+    """
+
+    def __init__(self, window=1.5, strategy='optimal', max_km=10, candidates_per_ride=10,
+                 offer_timeout=15, max_windows=3, index=None):
+        self.window = window
+        self.strategy = strategy
+        self.max_km = max_km
+        self.candidates_per_ride = candidates_per_ride
+        self.offer_timeout = offer_timeout
+        self.max_windows = max_windows
+        self.index = index  # a DriverLocationIndex; the dispatch index by default
+        self._pending = {}   # ride_id -> (ride, windows waited)
+        self._reserved = {}  # driver_id -> (ride_id, expires_at)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()  # set while rides are pending
+        self._worker = None
+
+    def submit(self, ride, windows=0):
+        with self._lock:
+            self._pending[ride.id] = (ride, windows)
+            self._wake.set()
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._serve, name='ride-matching', daemon=True)
+                self._worker.start()
+
+    def _serve(self):
+        while True:
+            self._wake.wait()
+            # Let the rest of the window's rides arrive
+            time.sleep(self.window)
+            self.flush()
+
+    def release_ride(self, ride_id):
+        """Let the drivers reserved for a ride be matched again"""
+        with self._lock:
+            for driver_id in [d for d, (r, _) in self._reserved.items() if r == ride_id]:
+                del self._reserved[driver_id]
+
+    def _reserved_drivers(self, now):
+        with self._lock:
+            for driver_id in [d for d, (_, expires_at) in self._reserved.items() if expires_at <= now]:
+                del self._reserved[driver_id]
+            return set(self._reserved)
+
+    def match(self, rides):
+        """Return ([(ride, driver_id, user_id, distance_km)], unmatched rides) for one window"""
+        index = self.index
+        if index is None:
+            load_driver_index()
+            index = driver_index
+        reserved = self._reserved_drivers(time.monotonic())
+        candidates = {}
+        for ride in rides:
+            for _, driver_id, user_id in index.nearest(
+                    ride.pickup_lat, ride.pickup_lng, k=self.candidates_per_ride,
+                    radius_km=self.max_km, exclude=reserved):
+                candidates[driver_id] = user_id
+        if not candidates:
+            return [], list(rides)
+
+        driver_ids = list(candidates)
+        positions = [index.position(driver_id) for driver_id in driver_ids]
+        driver_points = [(p[1], p[2]) if p else (math.nan, math.nan) for p in positions]
+        ride_points = [(float(ride.pickup_lat), float(ride.pickup_lng)) for ride in rides]
+        matrix = distance_matrix(ride_points, driver_points)
+        pairs = STRATEGIES[self.strategy](matrix, self.max_km)
+
+        matched_rides = {i for i, _ in pairs}
+        matches = [(rides[i], driver_ids[j], candidates[driver_ids[j]], float(matrix[i][j])) for i, j in pairs]
+        return matches, [ride for i, ride in enumerate(rides) if i not in matched_rides]
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._wake.clear()
+        if not pending:
+            return
+
+        try:
+            self._dispatch(pending)
+        except Exception as e:
+            logger.error(f"Failed to match {len(pending)} rides: {str(e)}", exc_info=True)
+            # Rides not yet handled get another window; the redispatcher covers the rest
+            for ride, windows in pending.values():
+                if windows + 1 < self.max_windows:
+                    self.submit(ride, windows + 1)
+        finally:
+            close_old_connections()
+
+    def _dispatch(self, pending):
+        """Offer one window's rides, removing each from pending once handled"""
+        # Skip rides cancelled (or accepted from an earlier offer) meanwhile
+        still_requested = set(Ride.objects.filter(id__in=list(pending), status='REQUESTED').values_list('id', flat=True))
+        for ride_id in [ride_id for ride_id in pending if ride_id not in still_requested]:
+            del pending[ride_id]
+        rides = [ride for ride, _ in pending.values()]
+        if not rides:
+            return
+
+        start = time.perf_counter()
+        matches, unmatched = self.match(rides)
+        logger.info(f"Matched {len(matches)}/{len(rides)} rides in {(time.perf_counter() - start) * 1000:.1f}ms "
+                    f"({self.strategy}, {sum(m[3] for m in matches):.1f} km total pickup distance)")
+
+        expires_at = time.monotonic() + self.offer_timeout
+        for ride, driver_id, user_id, _ in matches:
+            with self._lock:
+                self._reserved[driver_id] = (ride.id, expires_at)
+            offer_ride(ride, [(driver_id, user_id)])
+            del pending[ride.id]
+
+        for ride in unmatched:
+            windows = pending.pop(ride.id)[1] + 1
+            if windows < self.max_windows:
+                self.submit(ride, windows)
+            else:
+                logger.info(f"Ride {ride.id} unmatched after {windows} windows, broadcasting")
+                notify_available_drivers(ride)
+
+ride_matcher = RideMatcher(
+    window=getattr(settings, 'MATCHING_WINDOW', 1.5),
+    strategy=getattr(settings, 'MATCHING_STRATEGY', 'optimal'),
+    max_km=getattr(settings, 'DISPATCH_RADIUS_KM', 10),
+    candidates_per_ride=getattr(settings, 'MATCHING_CANDIDATES_PER_RIDE', 10),
+    offer_timeout=getattr(settings, 'MATCHING_OFFER_TIMEOUT', 15),
+    max_windows=getattr(settings, 'MATCHING_MAX_WINDOWS', 3),
+)
+
+def dispatch_ride(ride):
+    """Offer a newly booked ride to drivers according to DISPATCH_MODE"""
+    if getattr(settings, 'DISPATCH_MODE', 'broadcast') == 'batched':
+        ride_matcher.submit(ride)
+        # Give the matching windows time before widening the search
+        delay = ride_matcher.window * ride_matcher.max_windows + ride_matcher.offer_timeout
+    else:
+        notify_available_drivers(ride)
+        delay = None
+    redispatcher.schedule(ride.id, delay=delay)
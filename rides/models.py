@@ -3,6 +3,11 @@ from django.db import models
 from users.models import User
 from drivers.models import Driver
 
+class RideQuerySet(models.QuerySet):
+    def with_details(self):
+        """Join everything RideDetailSerializer touches so listings don't query per row"""
+        return self.select_related('user__profile', 'driver__user')
+
 class Ride(models.Model):
     STATUS_CHOICES = (
         ('REQUESTED', 'Requested'),
@@ -26,5 +31,69 @@ class Ride(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     estimated_fare = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     
+    objects = RideQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [
+            # Keyset pagination for admin and user ride history
+            models.Index(fields=['-created_at', '-id'], name='ride_created_idx'),
+            models.Index(fields=['user', '-created_at', '-id'], name='ride_user_created_idx'),
+            # Dashboard recounts by status
+            models.Index(fields=['status'], name='ride_status_idx'),
+            # Partial indexes over the few rides still in flight (PostgreSQL
+            # and SQLite; other backends skip them): re-dispatch rehydration
+            # and live tracking load only these
+            models.Index(fields=['-created_at'], name='ride_requested_idx',
+                         condition=models.Q(status='REQUESTED')),
+            models.Index(fields=['driver'], name='ride_active_driver_idx',
+                         condition=models.Q(status__in=['ACCEPTED', 'PICKED_UP'])),
+        ]
+    
     def __str__(self):
         return f"Ride {self.id}: {self.user.email} - {self.status}"
+
+class ArchivedRide(models.Model):
+    """A COMPLETED or CANCELLED ride moved out of the Ride table by rides.archive.
+
+    Keeps the ride's id and timestamps, so listings merge both tables in one
+    (created_at, id) order and ride ids stay unique across them.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_rides')
+    driver = models.ForeignKey(Driver, on_delete=models.SET_NULL, related_name='archived_rides', null=True, blank=True)
+    pickup_location = models.CharField(max_length=255)
+    pickup_lat = models.DecimalField(max_digits=9, decimal_places=6)
+    pickup_lng = models.DecimalField(max_digits=9, decimal_places=6)
+    destination = models.CharField(max_length=255)
+    destination_lat = models.DecimalField(max_digits=9, decimal_places=6)
+    destination_lng = models.DecimalField(max_digits=9, decimal_places=6)
+    status = models.CharField(max_length=15, choices=Ride.STATUS_CHOICES)
+    ride_type = models.CharField(max_length=100)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    estimated_fare = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    objects = RideQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='archived_ride_created_idx'),
+            models.Index(fields=['user', '-created_at', '-id'], name='archived_ride_user_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Archived ride {self.id}: {self.user.email} - {self.status}"
+
+class RideOffer(models.Model):
+    """A driver who was notified about a ride while it was REQUESTED"""
+    ride = models.ForeignKey(Ride, on_delete=models.CASCADE, related_name='offers')
+    driver = models.ForeignKey(Driver, on_delete=models.CASCADE, related_name='ride_offers')
+    offered_at = models.DateTimeField(auto_now_add=True)
+    accepted_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        unique_together = ('ride', 'driver')
+    
+    def __str__(self):
+        return f"Offer of ride {self.ride_id} to driver {self.driver_id}"
@@ -0,0 +1,70 @@
+import logging
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.utils import timezone
+from .models import RideOffer
+
+logger = logging.getLogger(__name__)
+
+class OfferRegistry:
+    """Which drivers each ride was offered to.
+
+    Offers are persisted as RideOffer rows and kept in a bounded in-memory map
+    of ride id -> tuple of (driver_id, user_id), so the cancellation path
+    usually answers from memory and falls back to one query otherwise.
+    """
+
+    def __init__(self, max_rides=10000):
+        self.max_rides = max_rides
+        self._offers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, ride_id, targets):
+        with self._lock:
+            self._offers[ride_id] = targets
+            self._offers.move_to_end(ride_id)
+            while len(self._offers) > self.max_rides:
+                self._offers.popitem(last=False)
+
+    def record(self, ride_id, targets):
+        """Persist offers of a ride to (driver_id, user_id) targets"""
+        ride_id = int(ride_id)
+        targets = tuple(targets)
+        RideOffer.objects.bulk_create(
+            [RideOffer(ride_id=ride_id, driver_id=driver_id) for driver_id, _ in targets],
+            ignore_conflicts=True,
+        )
+        with self._lock:
+            known = self._offers.get(ride_id, ())
+        merged = known + tuple(t for t in targets if t not in known)
+        self._remember(ride_id, merged)
+
+    def targets(self, ride_id):
+        """Return the (driver_id, user_id) pairs a ride was offered to"""
+        ride_id = int(ride_id)
+        with self._lock:
+            targets = self._offers.get(ride_id)
+        if targets is None:
+            targets = tuple(RideOffer.objects.filter(ride_id=ride_id).values_list('driver_id', 'driver__user_id'))
+            self._remember(ride_id, targets)
+        return targets
+
+    def mark_accepted(self, ride_id, driver_id):
+        """Stamp the winning offer and return the offer-to-accept latency, if it was offered"""
+        ride_id = int(ride_id)
+        self.forget(ride_id)
+        now = timezone.now()
+        offer = RideOffer.objects.filter(ride_id=ride_id, driver_id=driver_id).only('offered_at').first()
+        if offer is None:
+            return None
+        RideOffer.objects.filter(pk=offer.pk).update(accepted_at=now)
+        latency = now - offer.offered_at
+        logger.info(f"Ride {ride_id} accepted by driver {driver_id} {latency.total_seconds():.2f}s after offer")
+        return latency
+
+    def forget(self, ride_id):
+        with self._lock:
+            self._offers.pop(int(ride_id), None)
+
+offer_registry = OfferRegistry(getattr(settings, 'RIDE_OFFER_CACHE_SIZE', 10000))
@@ -0,0 +1,85 @@
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+from .serializers import RideDetailSerializer
+
+class RidePayloadCache:
+    """LRU of RideDetailSerializer output encoded as JSON bytes.
+
+    Entries are versioned by ride.updated_at, so a stale instance never gets a
+    newer payload and a saved ride never serves an older one. Saves of the
+    ride, its user or its driver drop the entry (see rides.signals), but
+    only in the process that made them; entries also expire after ttl
+    seconds, which bounds how long a change to the user, profile or driver
+    made through another worker is served stale.
+    """
+
+    def __init__(self, max_entries=2048, ttl=5.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # ride_id -> (updated_at, user_id, driver_id, payload, expires)
+        self._lock = threading.Lock()
+        self._renderer = JSONRenderer()
+
+    def get(self, ride):
+        """Return the encoded detail payload for a ride, serializing only on a miss"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(ride.id)
+            if entry is not None and entry[0] == ride.updated_at and (entry[4] is None or entry[4] > now):
+                self._entries.move_to_end(ride.id)
+                return entry[3]
+
+        payload = self._renderer.render(RideDetailSerializer(ride).data)
+        expires = None if self.ttl is None else now + self.ttl
+        with self._lock:
+            self._entries[ride.id] = (ride.updated_at, ride.user_id, ride.driver_id, payload, expires)
+            self._entries.move_to_end(ride.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return payload
+
+    def invalidate(self, ride_id):
+        with self._lock:
+            self._entries.pop(ride_id, None)
+
+    def invalidate_user(self, user_id):
+        self._invalidate_where(lambda entry: entry[1] == user_id)
+
+    def invalidate_driver(self, driver_id):
+        self._invalidate_where(lambda entry: entry[2] == driver_id)
+
+    def invalidate_drivers(self, driver_ids):
+        self._invalidate_where(lambda entry: entry[2] in driver_ids)
+
+    def _invalidate_where(self, predicate):
+        with self._lock:
+            for ride_id in [ride_id for ride_id, entry in self._entries.items() if predicate(entry)]:
+                del self._entries[ride_id]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+ride_payloads = RidePayloadCache(
+    max_entries=getattr(settings, 'RIDE_PAYLOAD_CACHE_SIZE', 2048),
+    ttl=getattr(settings, 'RIDE_PAYLOAD_CACHE_TTL', 5),
+)
+
+def ride_payload(ride):
+    """Encoded RideDetailSerializer JSON for a ride"""
+    return ride_payloads.get(ride)
+
+def ride_frame(frame_type, ride):
+    """Websocket frame text of the form {"type": frame_type, "ride": <ride payload>}"""
+    return '{"type":"%s","ride":%s}' % (frame_type, ride_payload(ride).decode())
+
+def ride_response(ride, status=200, message=None):
+    """JSON response carrying the cached ride payload, optionally wrapped with a message"""
+    payload = ride_payload(ride)
+    if message is not None:
+        payload = b'{"message":%s,"ride":%s}' % (JSONRenderer().render(message), payload)
+    return HttpResponse(payload, status=status, content_type='application/json')
@@ -0,0 +1,185 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from drivers.geo import find_nearby_drivers
+from ws.utils import offer_ride
+from .models import Ride
+from .offers import offer_registry
+
+logger = logging.getLogger(__name__)
+
+class RedispatchScheduler:
+    """Re-offers rides that nobody accepted, each round a little further out.
+
+    Every outstanding offer has one entry in a heap ordered by its expiry,
+    so scheduling and expiring are O(log n) however many rides are waiting.
+    Cancelled entries are skipped when they surface rather than searched
+    for. The heap is served by one asyncio task on a private event-loop
+    thread; the database work of an expiry runs on a small thread pool.
+
+    When an offer expires on a ride that is still REQUESTED, the ride is
+    offered to the nearest drivers not yet offered it, within a radius that
+    grows by radius_growth per round, up to max_rounds rounds. After a
+    restart rehydrate() rebuilds the timers from the REQUESTED rides.
+
+    Every worker process runs its own scheduler and rehydrates the same
+    rides, so a round is claimed before it is dispatched: a conditional
+    UPDATE moves the ride's updated_at forward, and matches only when no
+    worker has done so within the last half offer_timeout.
+    """
+
+    def __init__(self, offer_timeout=20, radius_km=10, radius_growth=1.5, max_radius_km=30,
+                 max_rounds=5, max_drivers=20, workers=4):
+        self.offer_timeout = offer_timeout
+        self.radius_km = radius_km
+        self.radius_growth = radius_growth
+        self.max_radius_km = max_radius_km
+        self.max_rounds = max_rounds
+        self.max_drivers = max_drivers
+        self.workers = workers
+        self._heap = []      # (due, sequence, ride_id, round)
+        self._active = {}    # ride_id -> sequence of its live heap entry
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._loop = None
+        self._wake = None
+        self._executor = None
+
+    def __len__(self):
+        return len(self._active)
+
+    def radius_for(self, round):
+        return min(self.radius_km * self.radius_growth ** round, self.max_radius_km)
+
+    def start(self, rehydrate=True):
+        """Start the scheduler thread once per process"""
+        with self._lock:
+            if self._loop is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='ride-redispatch')
+            threading.Thread(target=self._serve, name='ride-redispatch', daemon=True).start()
+        if rehydrate:
+            self._executor.submit(self.rehydrate)
+
+    def _serve(self):
+        asyncio.set_event_loop(self._loop)
+        self._wake = asyncio.Event()
+        self._loop.run_until_complete(self._run())
+
+    def _wakeup(self):
+        self._wake.set()
+
+    def schedule(self, ride_id, round=0, delay=None):
+        """Expire the ride's current offer after delay seconds (offer_timeout by default)"""
+        self.start()
+        due = time.monotonic() + (self.offer_timeout if delay is None else delay)
+        with self._lock:
+            sequence = next(self._sequence)
+            self._active[ride_id] = sequence
+            heapq.heappush(self._heap, (due, sequence, ride_id, round))
+            # Drop skipped entries once they dominate the heap
+            if len(self._heap) > 2 * len(self._active) + 1024:
+                self._heap = [entry for entry in self._heap if self._active.get(entry[2]) == entry[1]]
+                heapq.heapify(self._heap)
+            earliest = self._heap[0][1] == sequence
+        if earliest:
+            # Runs on the loop, so only once _serve has created the event
+            self._loop.call_soon_threadsafe(self._wakeup)
+
+    def cancel(self, ride_id):
+        with self._lock:
+            self._active.pop(ride_id, None)
+
+    def _pop_due(self, now):
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                _, sequence, ride_id, round = heapq.heappop(self._heap)
+                if self._active.get(ride_id) == sequence:
+                    del self._active[ride_id]
+                    due.append((ride_id, round))
+            next_due = self._heap[0][0] if self._heap else None
+        return due, next_due
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Cleared first so a timer scheduled while popping still wakes the wait
+            self._wake.clear()
+            due, next_due = self._pop_due(time.monotonic())
+            for ride_id, round in due:
+                loop.run_in_executor(self._executor, self.expire, ride_id, round)
+
+            timeout = None if next_due is None else max(0.0, next_due - time.monotonic())
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def expire(self, ride_id, round):
+        """Offer a still-REQUESTED ride to the next ring of drivers and schedule the next round"""
+        try:
+            ride = Ride.objects.filter(id=ride_id, status='REQUESTED').first()
+            if ride is None:
+                return
+            round += 1
+            if round > self.max_rounds:
+                logger.warning(f"Ride {ride_id} still unaccepted after {self.max_rounds} re-dispatch rounds")
+                return
+
+            now = timezone.now()
+            claimed = Ride.objects.filter(
+                id=ride_id, status='REQUESTED', updated_at__lte=now - timedelta(seconds=self.offer_timeout / 2),
+            ).update(updated_at=now)
+            if not claimed:
+                # Another worker dispatched this round (or the ride was just accepted)
+                return
+
+            radius = self.radius_for(round)
+            offered = {driver_id for driver_id, _ in offer_registry.targets(ride_id)}
+            nearby = find_nearby_drivers(ride.pickup_lat, ride.pickup_lng, k=self.max_drivers,
+                                         radius_km=radius, exclude=offered)
+            if nearby:
+                offer_ride(ride, [(driver_id, user_id) for _, driver_id, user_id in nearby])
+            logger.info(f"Re-dispatched ride {ride_id} (round {round}, {radius:.1f} km) to {len(nearby)} more drivers")
+            self.schedule(ride_id, round)
+        except Exception as e:
+            logger.error(f"Failed to re-dispatch ride {ride_id}: {str(e)}", exc_info=True)
+        finally:
+            close_old_connections()
+
+    def rehydrate(self):
+        """Recreate the timers of REQUESTED rides, e.g. after a restart; returns how many"""
+        try:
+            now = timezone.now()
+            horizon = now - timedelta(seconds=self.offer_timeout * (self.max_rounds + 1))
+            count = 0
+            rides = Ride.objects.filter(status='REQUESTED', created_at__gte=horizon).values_list('id', 'created_at')
+            for ride_id, created_at in rides.iterator():
+                # Pick up at the round the ride would have reached by now
+                waited = (now - created_at).total_seconds()
+                round = int(waited // self.offer_timeout)
+                self.schedule(ride_id, round, delay=(round + 1) * self.offer_timeout - waited)
+                count += 1
+            logger.info(f"Rehydrated {count} re-dispatch timers")
+            return count
+        finally:
+            close_old_connections()
+
+redispatcher = RedispatchScheduler(
+    offer_timeout=getattr(settings, 'REDISPATCH_OFFER_TIMEOUT', 20),
+    radius_km=getattr(settings, 'DISPATCH_RADIUS_KM', 10),
+    radius_growth=getattr(settings, 'REDISPATCH_RADIUS_GROWTH', 1.5),
+    max_radius_km=getattr(settings, 'REDISPATCH_MAX_RADIUS_KM', 30),
+    max_rounds=getattr(settings, 'REDISPATCH_MAX_ROUNDS', 5),
+    max_drivers=getattr(settings, 'DISPATCH_MAX_DRIVERS', 20),
+)
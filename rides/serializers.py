@@ -1,6 +1,7 @@
 
 from rest_framework import serializers
 from .models import Ride
+from .fares import fare_engine
 from users.serializers import UserSerializer
 from drivers.serializers import DriverSerializer
 
@@ -13,9 +14,24 @@ class RideCreateSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         user = self.context['request'].user
         validated_data['user'] = user
-        # You might want to calculate estimated fare here based on distance
+        # Usually a memoized lookup: the app quotes the same trip before booking
+        _, validated_data['estimated_fare'] = fare_engine.quote(
+            validated_data['pickup_lat'], validated_data['pickup_lng'],
+            validated_data['destination_lat'], validated_data['destination_lng'],
+            validated_data.get('ride_type'))
         return super().create(validated_data)
 
+class RideTypeField(serializers.ChoiceField):
+    """A ride type with a tariff, in any letter case"""
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = data.upper()
+        return super().to_internal_value(data)
+
+class FareQuoteSerializer(serializers.Serializer):
+    """The ride type of a fare quote; unset quotes the default tariff"""
+    ride_type = RideTypeField(choices=sorted(fare_engine.tariffs), required=False, allow_null=True)
+
 class RideDetailSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     driver = DriverSerializer(read_only=True)
@@ -0,0 +1,59 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.contrib.auth import get_user_model
+from drivers.geo import driver_index, sync_driver
+from drivers.models import Driver
+from drivers.positions import position_store
+from users.models import UserProfile
+from ws.tracking import ride_tracker
+from ws.utils import send_ride_update, broadcast_ride_cancellation
+from .matching import ride_matcher
+from .models import Ride
+from .offers import offer_registry
+from .payloads import ride_payloads
+from .redispatch import redispatcher
+from .state import ride_transitioned
+
+User = get_user_model()
+
+@receiver([post_save, post_delete], sender=Ride)
+def invalidate_ride_payload(sender, instance, **kwargs):
+    ride_payloads.invalidate(instance.id)
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_user_ride_payloads(sender, instance, **kwargs):
+    ride_payloads.invalidate_user(instance.id)
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def invalidate_profile_ride_payloads(sender, instance, **kwargs):
+    ride_payloads.invalidate_user(instance.user_id)
+
+@receiver([post_save, post_delete], sender=Driver)
+def invalidate_driver_ride_payloads(sender, instance, **kwargs):
+    ride_payloads.invalidate_driver(instance.id)
+
+@receiver(ride_transitioned)
+def follow_ride_transition(sender, ride, old_status, new_status, **kwargs):
+    """Bring caches, dispatch and clients in line with a committed transition"""
+    ride_payloads.invalidate(ride.id)
+    ride_matcher.release_ride(ride.id)
+    redispatcher.cancel(ride.id)
+    
+    if new_status == 'ACCEPTED':
+        offer_registry.mark_accepted(ride.id, ride.driver_id)
+        driver_index.remove(ride.driver_id)
+    elif new_status == 'COMPLETED' and ride.driver is not None and ride.driver.status == 'AVAILABLE':
+        # Dispatchable again, at the last streamed position if there is one
+        latest = position_store.latest(ride.driver_id)
+        if latest is not None:
+            driver_index.update(ride.driver_id, ride.driver.user_id, latest[0], latest[1])
+        else:
+            sync_driver(ride.driver)
+    
+    # Tracks ACCEPTED (to pickup) and PICKED_UP (to destination), untracks the rest
+    ride_tracker.track_ride(ride)
+    
+    if new_status == 'CANCELLED':
+        broadcast_ride_cancellation(str(ride.id), str(ride.user_id))
+    else:
+        send_ride_update(ride)
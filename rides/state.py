@@ -0,0 +1,120 @@
+import logging
+from django.db import transaction
+from django.dispatch import Signal
+from django.utils import timezone
+from adminpanel import counters
+from drivers.models import Driver
+from ws.dashboard import publish_ride_status, publish_driver_status
+from .models import Ride
+
+logger = logging.getLogger(__name__)
+
+# new ride status -> (status it must come from, driver status it must come
+# from, driver status afterwards); None where the driver is left alone
+TRANSITIONS = {
+    'ACCEPTED': ('REQUESTED', 'AVAILABLE', 'BUSY'),
+    'PICKED_UP': ('ACCEPTED', None, None),
+    'COMPLETED': ('PICKED_UP', 'BUSY', 'AVAILABLE'),
+    'CANCELLED': ('REQUESTED', None, None),
+}
+
+# Sent once per transition after it commits, with ride (updated in place),
+# old_status and new_status. Receivers in rides.signals do the notifying.
+ride_transitioned = Signal()
+
+class RideUnavailable(Exception):
+    """The ride does not exist, is not assigned to the driver, or is not in the required status"""
+
+class DriverUnavailable(Exception):
+    """The driver's status changed, or it is not AVAILABLE when that is required"""
+
+def transition(ride, new_status, driver=None):
+    """Move a ride to new_status with guarded UPDATEs and emit ride_transitioned.
+
+    The ride UPDATE only matches while the ride still has the status the
+    transition starts from (and, past acceptance, is assigned to `driver`),
+    so concurrent transitions cannot both win. The driver's status moves in
+    the same transaction, guarded the same way: only an AVAILABLE driver can
+    accept, and only a BUSY one is freed on completion. Losing the ride
+    UPDATE, or the driver UPDATE of an acceptance, raises and rolls back.
+
+    `ride` is either an instance loaded with_details(), updated in place, or
+    an id. For an id the ride is loaded with_details() only once its UPDATE
+    has matched, so callers that lose a race never read it and the winner
+    reads it exactly once.
+    """
+    from_status, driver_from, driver_status = TRANSITIONS[new_status]
+    loaded = isinstance(ride, Ride)
+    ride_id = ride.id if loaded else ride
+    if loaded and ride.status != from_status:
+        raise RideUnavailable(ride_id)
+
+    now = timezone.now()
+    rides = Ride.objects.filter(id=ride_id, status=from_status)
+    changes = {'status': new_status, 'updated_at': now}
+    if new_status == 'ACCEPTED':
+        changes['driver'] = driver
+    elif driver is not None:
+        rides = rides.filter(driver=driver)
+    target = driver or (ride.driver if loaded else None)
+
+    with transaction.atomic():
+        if not rides.update(**changes):
+            raise RideUnavailable(ride_id)
+
+        old_driver_status = None
+        if driver_status is not None and target is not None:
+            moved = Driver.objects.filter(id=target.id, status=driver_from).update(status=driver_status, updated_at=now)
+            if moved:
+                old_driver_status = driver_from
+            elif new_status == 'ACCEPTED':
+                raise DriverUnavailable(target.id)
+            else:
+                logger.warning(f"Driver {target.id} changed status during ride {ride_id} {new_status.lower()}; left as is")
+
+        # queryset.update() skips the model signals, so apply their effects here.
+        # The counter rows are shared by every transition, so they are updated
+        # after the commit rather than held locked for the rest of this one
+        status_changes = counters.ride_status_changes(from_status, new_status)
+        if old_driver_status is not None:
+            status_changes.update(counters.driver_status_changes(old_driver_status, driver_status))
+        transaction.on_commit(lambda: counters.increment(status_changes))
+        publish_ride_status(ride_id, new_status)
+        if old_driver_status is not None and old_driver_status != driver_status:
+            publish_driver_status(target.id, driver_status)
+
+        if not loaded:
+            ride = Ride.objects.with_details().get(id=ride_id)
+
+    if old_driver_status is not None:
+        target.status = target._counted_status = driver_status
+        target.updated_at = now
+    if loaded:
+        ride.status = ride._counted_status = new_status
+        ride.updated_at = now
+        if driver is not None:
+            ride.driver = driver
+
+    logger.info(f"Ride {ride_id} {from_status} -> {new_status}")
+    transaction.on_commit(lambda: ride_transitioned.send(
+        sender=Ride, ride=ride, old_status=from_status, new_status=new_status))
+    return ride
+
+def accept_ride(ride_id, driver):
+    """REQUESTED -> ACCEPTED by an AVAILABLE driver, who becomes BUSY"""
+    # Fails fast on the loaded status; the guarded UPDATE has the final say
+    if driver.status != 'AVAILABLE':
+        raise DriverUnavailable(driver.id)
+    return transition(ride_id, 'ACCEPTED', driver)
+
+def pick_up_ride(ride_id, driver):
+    """ACCEPTED -> PICKED_UP by the assigned driver"""
+    return transition(ride_id, 'PICKED_UP', driver)
+
+def complete_ride(ride_id, driver):
+    """PICKED_UP -> COMPLETED by the assigned driver, who becomes AVAILABLE again"""
+    return transition(ride_id, 'COMPLETED', driver)
+
+def cancel_ride(ride):
+    """REQUESTED -> CANCELLED, typically by the patient"""
+    return transition(ride, 'CANCELLED')
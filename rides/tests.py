@@ -0,0 +1,26 @@
+from django.test import TestCase
+from rest_framework.test import APIClient
+from ambuk_backend.testing import LISTING_PARAMS, assert_max_queries, create_driver, create_rides
+from users.models import User
+
+class UserRidesQueryBudgetTest(TestCase):
+    """A patient's ride history runs the same number of queries for a few rides as for many"""
+
+    def setUp(self):
+        self.user = User.objects.create(email='patient@example.com', username='patient')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_user_rides(self):
+        driver = create_driver('history')
+        other = User.objects.create(email='other@example.com', username='other')
+        for rides in (2, 40):
+            create_rides(rides, self.user, driver)
+            create_rides(rides, other)
+            for params in LISTING_PARAMS:
+                # One query on the live and one on the archived rides
+                with self.subTest(rides=rides, params=params), assert_max_queries(2):
+                    response = self.client.get('/api/user/rides/' + params)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                    self.assertEqual(response.status_code, 200)
@@ -1,9 +1,10 @@
 
 from django.urls import path
-from .views import BookRideView, UserRidesView, RideDetailView
+from .views import BookRideView, FareQuoteView, UserRidesView, RideDetailView
 
 urlpatterns = [
     path('book-ride/', BookRideView.as_view(), name='book-ride'),
+    path('fare-quote/', FareQuoteView.as_view(), name='fare-quote'),
     path('user/rides/', UserRidesView.as_view(), name='user-rides'),
     path('user/rides/<int:ride_id>/', RideDetailView.as_view(), name='ride-detail'),
 ]
@@ -2,12 +2,18 @@
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from .serializers import RideCreateSerializer, RideDetailSerializer
-from .models import Ride
+from .serializers import RideCreateSerializer, RideDetailSerializer, FareQuoteSerializer
+from .models import Ride, ArchivedRide
+from .archive import ride_history
+from .matching import dispatch_ride
+from .state import accept_ride, cancel_ride, RideUnavailable, DriverUnavailable
+from .payloads import ride_response
+from .fares import fare_engine, valid_point
+from django.conf import settings
 from django.shortcuts import get_object_or_404
-from django.db import transaction
 from drivers.models import Driver
-from ws.utils import notify_available_drivers, send_ride_update
+from ambuk_backend.pagination import list_response
+from ambuk_backend.routers import ReplicaReadMixin, stick_to_primary
 import logging
 
 logger = logging.getLogger(__name__)
@@ -18,30 +24,64 @@ class BookRideView(APIView):
         
         if serializer.is_valid():
             ride = serializer.save()
+            stick_to_primary(request.user)
             
-            # Notify available drivers
-            notify_available_drivers(ride)
+            # Notify available drivers (at once, or in the next matching window)
+            dispatch_ride(ride)
             
             logger.info(f"New ride created: {ride.id}, notifying drivers")
-            return Response(RideDetailSerializer(ride).data, status=status.HTTP_201_CREATED)
+            return ride_response(ride, status=status.HTTP_201_CREATED)
         
         logger.warning(f"Failed to create ride: {serializer.errors}")
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class UserRidesView(APIView):
+class FareQuoteView(APIView):
+    """Price trips from one or many candidate pickups to a destination in one call"""
+    def post(self, request):
+        pickups = request.data.get('pickups')
+        if pickups is None and 'pickup_lat' in request.data:
+            pickups = [{'lat': request.data.get('pickup_lat'), 'lng': request.data.get('pickup_lng')}]
+        max_points = getattr(settings, 'FARE_QUOTE_MAX_POINTS', 500)
+        
+        try:
+            destination = (float(request.data['destination_lat']), float(request.data['destination_lng']))
+            points = [(float(p['lat']), float(p['lng'])) for p in pickups]
+        except (KeyError, TypeError, ValueError):
+            return Response({"error": "Expected destination_lat, destination_lng and pickups [{lat, lng}]"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not points or len(points) > max_points:
+            return Response({"error": f"Between 1 and {max_points} pickups can be quoted at once"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not all(valid_point(lat, lng) for lat, lng in points + [destination]):
+            return Response({"error": "Invalid coordinates"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        serializer = FareQuoteSerializer(data={'ride_type': request.data.get('ride_type')})
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        ride_type = fare_engine.tariff_type(serializer.validated_data['ride_type'])
+        quotes = fare_engine.quote_many(points, destination, ride_type)
+        return Response({
+            "ride_type": ride_type,
+            "quotes": [
+                {"pickup_lat": lat, "pickup_lng": lng, "distance_km": distance, "estimated_fare": str(fare)}
+                for (lat, lng), (distance, fare) in zip(points, quotes)
+            ]
+        })
+
+class UserRidesView(ReplicaReadMixin, APIView):
     def get(self, request):
-        rides = request.user.rides.all().order_by('-created_at')
-        serializer = RideDetailSerializer(rides, many=True)
-        return Response(serializer.data)
+        # Live and archived rides, merged newest first
+        return list_response(request, ride_history(request.user), RideDetailSerializer)
 
-class RideDetailView(APIView):
+class RideDetailView(ReplicaReadMixin, APIView):
     def get(self, request, ride_id):
-        ride = get_object_or_404(Ride, id=ride_id, user=request.user)
-        serializer = RideDetailSerializer(ride)
-        return Response(serializer.data)
+        ride = Ride.objects.with_details().filter(id=ride_id, user=request.user).first()
+        if ride is None:
+            ride = get_object_or_404(ArchivedRide.objects.with_details(), id=ride_id, user=request.user)
+        return ride_response(ride)
     
     def put(self, request, ride_id):
-        ride = get_object_or_404(Ride, id=ride_id, user=request.user)
+        ride = get_object_or_404(Ride.objects.with_details(), id=ride_id, user=request.user)
         
         # Only allow status updates from REQUESTED to CANCELLED
         if ride.status != 'REQUESTED':
@@ -53,16 +93,17 @@ class RideDetailView(APIView):
             logger.warning(f"Invalid ride status update for ride {ride.id}: {status_update}")
             return Response({"error": "Invalid status update"}, status=status.HTTP_400_BAD_REQUEST)
         
-        ride.status = status_update
-        ride.save()
+        try:
+            # Drivers who were offered the ride hear about it once this commits
+            cancel_ride(ride)
+        except RideUnavailable:
+            logger.warning(f"Ride {ride.id} changed status before it could be cancelled")
+            return Response({"error": "Ride cannot be modified at this stage"}, status=status.HTTP_400_BAD_REQUEST)
         
+        stick_to_primary(request.user)
         logger.info(f"Ride {ride.id} cancelled by user {request.user.id}")
         
-        # Notify all drivers about the cancellation
-        from ws.utils import broadcast_ride_cancellation
-        broadcast_ride_cancellation(str(ride.id), str(request.user.id))
-        
-        return Response(RideDetailSerializer(ride).data)
+        return ride_response(ride)
 
 class RideAcceptanceView(APIView):
     """Dedicated API for ride acceptance with transaction guarantees and immediate user notification"""
@@ -76,45 +117,21 @@ class RideAcceptanceView(APIView):
             logger.warning("Missing ride_id or driver_id in ride acceptance request")
             return Response({"error": "Missing ride ID or driver ID"}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Use a transaction to ensure atomicity
         try:
-            with transaction.atomic():
-                # Lock the ride for update to prevent race conditions
-                ride = Ride.objects.select_for_update().get(id=ride_id, status='REQUESTED')
-                
-                # Get the driver
-                driver = Driver.objects.select_for_update().get(id=driver_id, status='AVAILABLE')
-                
-                # Update the ride
-                ride.driver = driver
-                ride.status = 'ACCEPTED'
-                ride.save()
-                
-                # Update the driver status to BUSY
-                driver.status = 'BUSY'
-                driver.save()
-                
-                logger.info(f"Ride {ride_id} accepted by driver {driver_id} successfully")
-                
-                # Immediately notify the user about ride acceptance - with retry mechanism
-                notification_sent = send_ride_update(ride)
-                
-                if not notification_sent:
-                    logger.warning(f"Failed to notify user {ride.user.id} about ride {ride.id} acceptance. "
-                                 f"Will continue to retry in background.")
-                    
-                    # In a real-world scenario, you might want to queue these notifications
-                    # or handle them with a background task
-                
-                return Response(RideDetailSerializer(ride).data, status=status.HTTP_200_OK)
+            driver = Driver.objects.only('id', 'user_id', 'status').get(id=driver_id)
+            
+            # Guarded UPDATEs instead of row locks; the user is notified after commit
+            ride = accept_ride(ride_id, driver)
+            
+            return ride_response(ride, status=status.HTTP_200_OK)
                 
-        except Ride.DoesNotExist:
+        except RideUnavailable:
             logger.warning(f"Ride {ride_id} not found or already accepted")
             return Response(
                 {"error": "Ride not found or already accepted", "code": "RIDE_UNAVAILABLE"}, 
                 status=status.HTTP_404_NOT_FOUND
             )
-        except Driver.DoesNotExist:
+        except (Driver.DoesNotExist, DriverUnavailable):
             logger.warning(f"Driver {driver_id} not found or not available")
             return Response(
                 {"error": "Driver not found or not available", "code": "DRIVER_UNAVAILABLE"}, 
@@ -15,6 +15,11 @@ class WebSocketService {
   private baseUrl: string;
   private userId: string | null = null;
   private path: string;
+  // Replay: seqs are "<origin>:<n>" tokens, unordered across server workers,
+  // so duplicates are dropped by identity and the last one seen is resumed from
+  private lastSeq: string | null = null;
+  private seenSeqs: Set<string> = new Set();
+  private maxSeenSeqs: number = 500;
 
   constructor(path: string) {
     this.baseUrl = this.getBaseUrl();
@@ -76,9 +81,23 @@ class WebSocketService {
       url += `/${this.userId}`;
     }
     url = url.replace(/([^:]\/)\/+/g, '$1'); // Clean up any duplicate slashes
+
+    const params = new URLSearchParams();
+    // The server authenticates sockets from the same access token as the REST API
+    const token = localStorage.getItem('token');
+    if (token) {
+      params.set('token', token);
+    }
+    if (this.lastSeq) {
+      // Ask the server to replay what was missed while disconnected
+      params.set('last_seq', this.lastSeq);
+    }
+    if (params.toString()) {
+      url += `?${params.toString()}`;
+    }
     
     try {
-      console.log('Connecting to WebSocket:', url);
+      console.log('Connecting to WebSocket:', url.split('?')[0]); // Keep the token out of logs
       this.socket = new WebSocket(url);
 
       // Set a timeout for connection
@@ -110,6 +129,15 @@ class WebSocketService {
       this.socket.onmessage = (event) => {
         try {
           const data = JSON.parse(event.data);
+          if (typeof data.seq === 'string') {
+            if (this.seenSeqs.has(data.seq)) {
+              return; // Already delivered, live or by a replay
+            }
+            this.rememberSeq(data.seq);
+          } else if (data.type === 'replay_gap' && data.last_seq) {
+            // Handlers should refetch their state over REST; resume after this point next time
+            this.rememberSeq(data.last_seq);
+          }
           console.log('WebSocket message received:', data);
           this.messageHandlers.forEach(handler => handler(data));
         } catch (error) {
@@ -150,6 +178,15 @@ class WebSocketService {
     }
   }
   
+  private rememberSeq(seq: string) {
+    this.lastSeq = seq;
+    this.seenSeqs.add(seq);
+    if (this.seenSeqs.size > this.maxSeenSeqs) {
+      // Sets iterate in insertion order, so this forgets the oldest
+      this.seenSeqs.delete(this.seenSeqs.values().next().value as string);
+    }
+  }
+
   // Start periodic pings to keep connection alive
   private startPingInterval() {
     if (this.pingInterval) {
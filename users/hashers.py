@@ -0,0 +1,70 @@
+import importlib.util
+import logging
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher, BCryptSHA256PasswordHasher, PBKDF2PasswordHasher
+
+logger = logging.getLogger(__name__)
+
+# Django looks hashers up by dotted path; keep these in sync with the classes below
+HASHERS = {
+    'argon2': ('users.hashers.TunedArgon2PasswordHasher', 'argon2'),
+    'bcrypt': ('users.hashers.TunedBCryptSHA256PasswordHasher', 'bcrypt'),
+    'pbkdf2': ('users.hashers.TunedPBKDF2PasswordHasher', None),
+}
+
+# Django's other default hashers, to keep verifying hashes they produced
+VERIFY_ONLY = [
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
+def installed_hashers():
+    """Names in HASHERS whose library is importable, in order of preference"""
+    return [name for name, (_, module) in HASHERS.items()
+            if module is None or importlib.util.find_spec(module) is not None]
+
+def password_hashers(preferred=None):
+    """PASSWORD_HASHERS with `preferred` first and the rest kept for verifying older hashes.
+
+    Django rehashes a password with the first hasher whenever it verifies
+    one stored by another hasher or with other parameters, so switching
+    here (or retuning the costs) upgrades users as they log in. Without a
+    preference the first installed of argon2, bcrypt and pbkdf2 is used; a
+    preferred hasher whose library is missing falls back to PBKDF2.
+    """
+    if preferred is not None and preferred not in HASHERS:
+        raise ValueError(f"Unknown PASSWORD_HASHER {preferred!r}, expected one of {', '.join(HASHERS)}")
+    available = installed_hashers()
+    if preferred is None:
+        preferred = available[0]
+    elif preferred not in available:
+        logger.warning(f"{HASHERS[preferred][1]} is not installed, hashing passwords with PBKDF2")
+        preferred = 'pbkdf2'
+    return ([HASHERS[preferred][0]] + [HASHERS[name][0] for name in available if name != preferred]
+            + VERIFY_ONLY)
+
+# Costs are read from settings on use, so this module can be imported by the settings module
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    @property
+    def time_cost(self):
+        return getattr(settings, 'ARGON2_TIME_COST', Argon2PasswordHasher.time_cost)
+
+    @property
+    def memory_cost(self):  # KiB
+        return getattr(settings, 'ARGON2_MEMORY_COST', Argon2PasswordHasher.memory_cost)
+
+    @property
+    def parallelism(self):
+        return getattr(settings, 'ARGON2_PARALLELISM', Argon2PasswordHasher.parallelism)
+
+class TunedBCryptSHA256PasswordHasher(BCryptSHA256PasswordHasher):
+    @property
+    def rounds(self):
+        return getattr(settings, 'BCRYPT_ROUNDS', BCryptSHA256PasswordHasher.rounds)
+
+class TunedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        # Django's default unless overridden, so upgrades never rehash to fewer iterations
+        return getattr(settings, 'PBKDF2_ITERATIONS', PBKDF2PasswordHasher.iterations)
@@ -0,0 +1,81 @@
+import time
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import identify_hasher
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory
+from users.hashers import installed_hashers, password_hashers
+from users.models import User
+from users.ratelimit import email_limiter, ip_limiter
+from users.views import LoginView
+
+BENCH_DOMAIN = 'bench-login.local'
+PASSWORD = 'correct horse battery staple'
+
+def rate(action, seconds):
+    """Calls of action per second on this thread, i.e. on one core"""
+    count = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        action()
+        count += 1
+    return count / (time.perf_counter() - start)
+
+class Command(BaseCommand):
+    help = 'Benchmark logins/sec per core for each password hasher, and throttled rejections'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hashers', default=','.join(installed_hashers()),
+                            help='Comma separated hashers to compare (default: those installed)')
+        parser.add_argument('--seconds', type=float, default=3, help='Seconds to measure each case')
+
+    def handle(self, *args, **options):
+        self.cleanup()
+        try:
+            for name in options['hashers'].split(','):
+                hashers = password_hashers(name.strip())
+                with override_settings(PASSWORD_HASHERS=hashers):
+                    self.bench_hasher(name.strip(), options['seconds'])
+            self.bench_rejections(options['seconds'])
+        finally:
+            self.cleanup()
+
+    def bench_hasher(self, name, seconds):
+        email = f'{name}@{BENCH_DOMAIN}'
+        user = User.objects.create_user(email=email, username=email, password=PASSWORD, user_type='DRIVER')
+        algorithm = identify_hasher(user.password).algorithm
+        ok = rate(lambda: authenticate(username=email, password=PASSWORD), seconds)
+        failed = rate(lambda: authenticate(username=email, password='wrong'), seconds)
+        self.stdout.write(f"{name:>7} ({algorithm}): {ok:.1f} logins/s, {failed:.1f} failed logins/s per core")
+
+        # A hash from the old default is upgraded on the first successful login
+        with override_settings(PASSWORD_HASHERS=password_hashers('pbkdf2')):
+            user.set_password(PASSWORD)
+            user.save(update_fields=['password'])
+        authenticate(username=email, password=PASSWORD)
+        user.refresh_from_db()
+        self.stdout.write(f"         pbkdf2 hash rehashed on login to {identify_hasher(user.password).algorithm}")
+
+    def bench_rejections(self, seconds):
+        email = f'pbkdf2@{BENCH_DOMAIN}'
+        factory = APIRequestFactory()
+        view = LoginView.as_view()
+        # Exhaust the budgets first, so every measured attempt is rejected
+        for _ in range(email_limiter.capacity + ip_limiter.capacity):
+            email_limiter.take(email)
+            ip_limiter.take('127.0.0.1')
+
+        statuses = set()
+
+        def attempt():
+            request = factory.post('/api/user/login/', {'email': email, 'password': 'wrong'}, format='json')
+            statuses.add(view(request).status_code)
+
+        rejected = rate(attempt, seconds)
+        self.stdout.write(f"throttled: {rejected:.0f} rejected attempts/s per core (status {sorted(statuses)})")
+        email_limiter.reset(email)
+        ip_limiter.reset('127.0.0.1')
+
+    def cleanup(self):
+        User.objects.filter(email__endswith=f'@{BENCH_DOMAIN}').delete()
@@ -0,0 +1,87 @@
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+
+class TokenBucketLimiter:
+    """In-memory token buckets keyed by any string.
+
+    Each key holds up to `capacity` tokens and regains `refill_rate` per
+    second; an attempt takes one. At most max_keys buckets are kept, so a
+    spray of distinct keys cannot grow memory. Only a bucket that has
+    refilled is ever forgotten, as it would come back the same; while the
+    least recently used one is still refilling, new keys are turned away
+    instead, so a spray cannot reset an over-budget key either.
+
+    Buckets are per process: behind N workers a client can get up to N
+    times the budget, so divide the LOGIN_* rates by the worker count.
+    """
+
+    def __init__(self, capacity=10, refill_rate=0.1, max_keys=100000):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def take(self, key, now=None):
+        """Take a token; returns 0 if one was available, else the seconds until one is"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated_at) * self.refill_rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.refill_rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                oldest_tokens, oldest_at = next(iter(self._buckets.values()))
+                refilled_in = (self.capacity - oldest_tokens) / self.refill_rate - (now - oldest_at)
+                if refilled_in > 0:
+                    del self._buckets[key]
+                    return max(wait, refilled_in)
+                self._buckets.popitem(last=False)
+        return wait
+
+    def reset(self, key):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+# Failed logins per email, and all logins per client address (allowing for shared NAT)
+email_limiter = TokenBucketLimiter(
+    capacity=getattr(settings, 'LOGIN_RATE_BURST', 10),
+    refill_rate=getattr(settings, 'LOGIN_RATE_PER_MINUTE', 6) / 60,
+)
+ip_limiter = TokenBucketLimiter(
+    capacity=getattr(settings, 'LOGIN_IP_RATE_BURST', 100),
+    refill_rate=getattr(settings, 'LOGIN_IP_RATE_PER_MINUTE', 60) / 60,
+)
+
+def email_key(email):
+    return str(email).strip().lower()
+
+def login_succeeded(email):
+    """Forgive the account's failed attempts once its password was right"""
+    email_limiter.reset(email_key(email))
+
+class LoginRateThrottle(BaseThrottle):
+    """Rejects login attempts over the per-email or per-IP budget before any password is hashed.
+
+    The login views reset the email's bucket after a successful login, so
+    only failed attempts use up an account's budget. Client addresses come
+    from get_ident, which trusts X-Forwarded-For only as far as the
+    NUM_PROXIES setting allows.
+    """
+
+    def allow_request(self, request, view):
+        email = request.data.get('email') if hasattr(request.data, 'get') else None
+        self._wait = ip_limiter.take(self.get_ident(request))
+        if email and not self._wait:
+            self._wait = email_limiter.take(email_key(email))
+        return not self._wait
+
+    def wait(self):
+        return self._wait
@@ -0,0 +1,17 @@
+from django.core.exceptions import ObjectDoesNotExist
+from rest_framework_simplejwt.tokens import RefreshToken
+
+def tokens_for_user(user):
+    """Issue a refresh/access pair whose claims identify the user without a DB lookup.
+
+    The access token inherits user_type (and driver_id for drivers), which the
+    websocket auth middleware trusts once the signature checks out.
+    """
+    refresh = RefreshToken.for_user(user)
+    refresh['user_type'] = user.user_type
+    if user.user_type == 'DRIVER':
+        try:
+            refresh['driver_id'] = user.driver.id
+        except ObjectDoesNotExist:
+            pass
+    return refresh
@@ -2,9 +2,10 @@
 from rest_framework import status, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework_simplejwt.tokens import RefreshToken
+from .tokens import tokens_for_user
 from django.contrib.auth import authenticate
 from .serializers import UserSerializer
+from .ratelimit import LoginRateThrottle, login_succeeded
 
 class SignupView(APIView):
     permission_classes = [permissions.AllowAny]
@@ -13,7 +14,7 @@ class SignupView(APIView):
         serializer = UserSerializer(data=request.data)
         if serializer.is_valid():
             user = serializer.save()
-            refresh = RefreshToken.for_user(user)
+            refresh = tokens_for_user(user)
             
             return Response({
                 'refresh': str(refresh),
@@ -24,18 +25,21 @@ class SignupView(APIView):
 
 class LoginView(APIView):
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [LoginRateThrottle]
     
     def post(self, request):
         email = request.data.get('email')
         password = request.data.get('password')
         
         user = authenticate(username=email, password=password)
+        if user:
+            login_succeeded(email)
         
         if user:
             if user.user_type != 'USER':
                 return Response({'error': 'Invalid user type'}, status=status.HTTP_403_FORBIDDEN)
                 
-            refresh = RefreshToken.for_user(user)
+            refresh = tokens_for_user(user)
             
             return Response({
                 'refresh': str(refresh),
@@ -0,0 +1,129 @@
+import logging
+import threading
+import time
+from urllib.parse import parse_qs
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+class IdentityCache:
+    """Short-lived cache of user_id -> {'user_id', 'user_type', 'driver_id'}.
+
+    Only consulted for tokens issued without identity claims and for the
+    URL-only development fallback, so reconnect storms from those clients
+    cost one query per user per TTL rather than one per connection.
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(str(user_id))
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        return None
+
+    def put(self, user_id, identity):
+        with self._lock:
+            self._entries[str(user_id)] = (time.monotonic() + self.ttl, identity)
+            if len(self._entries) > 10000:
+                now = time.monotonic()
+                self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+
+    def lookup(self, user_id):
+        """Return the cached identity, loading it from the database on a miss"""
+        if not self.ttl:
+            return self._load(user_id)
+        identity = self.get(user_id)
+        if identity is None:
+            identity = self._load(user_id)
+            # Unknown users are cached too, as an empty identity
+            self.put(user_id, identity or {})
+        return identity or None
+
+    def _load(self, user_id):
+        try:
+            row = User.objects.filter(id=user_id).values('id', 'user_type', 'driver__id').first()
+        except (ValueError, TypeError):
+            return None
+        if row is None:
+            return None
+        return {'user_id': row['id'], 'user_type': row['user_type'], 'driver_id': row['driver__id']}
+
+identity_cache = IdentityCache(getattr(settings, 'WS_IDENTITY_CACHE_TTL', 60))
+
+def identity_from_claims(claims):
+    """Identity dict from access token claims, or None when they predate user_type claims"""
+    if 'user_type' not in claims:
+        return None
+    return {
+        'user_id': claims[api_settings.USER_ID_CLAIM],
+        'user_type': claims['user_type'],
+        'driver_id': claims.get('driver_id'),
+    }
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """Authenticates websocket connections from a SimpleJWT access token.
+
+    The token is read from the `token` query-string parameter and verified
+    locally (signature and expiry), so there is no database hit on connect.
+    The result is stored in scope['identity'] (None if absent or invalid).
+    """
+
+    async def __call__(self, scope, receive, send):
+        scope = dict(scope)
+        scope['identity'] = await self.get_identity(scope)
+        return await super().__call__(scope, receive, send)
+
+    async def get_identity(self, scope):
+        params = parse_qs(scope.get('query_string', b'').decode())
+        raw_token = params.get('token', [None])[0]
+        if not raw_token:
+            return None
+
+        try:
+            claims = AccessToken(raw_token)
+        except TokenError as e:
+            logger.warning(f"Rejected websocket token: {str(e)}")
+            return None
+
+        identity = identity_from_claims(claims)
+        if identity is None:
+            # Token issued before identity claims were added
+            identity = identity_cache.get(claims[api_settings.USER_ID_CLAIM])
+            if identity is None:
+                identity = await database_sync_to_async(identity_cache.lookup)(claims[api_settings.USER_ID_CLAIM])
+        return identity or None
+
+async def authenticate_connection(scope, user_type):
+    """Return the identity for a consumer's connection if it is a `user_type`, else None.
+
+    The user_id in the URL must match the token. Connections without a token
+    are only accepted when WS_ALLOW_URL_IDENTITY is on (development), using
+    the cached identity of the URL's user_id.
+    """
+    url_user_id = scope['url_route']['kwargs'].get('user_id')
+    identity = scope.get('identity')
+
+    if identity is not None:
+        if url_user_id and str(identity['user_id']) != str(url_user_id):
+            logger.warning(f"Websocket token for user {identity['user_id']} used on the route of user {url_user_id}")
+            return None
+    elif url_user_id and getattr(settings, 'WS_ALLOW_URL_IDENTITY', False):
+        identity = identity_cache.get(url_user_id)
+        if identity is None:
+            identity = await database_sync_to_async(identity_cache.lookup)(url_user_id)
+
+    if not identity or identity['user_type'] != user_type:
+        return None
+    return identity
@@ -3,13 +3,17 @@ import json
 import logging
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from django.contrib.auth import get_user_model
-from drivers.models import Driver
+from drivers.positions import position_store, parse_position
+from .auth import authenticate_connection
+from .dashboard import ADMIN_DASHBOARD_GROUP
+from .dispatch import encode_frame
+from .heartbeat import HeartbeatMixin, pong_frame
+from .replay import event_text, replay_missed
+from .tracking import ride_tracker
 
-User = get_user_model()
 logger = logging.getLogger(__name__)
 
-class DriverNotificationConsumer(AsyncWebsocketConsumer):
+class DriverNotificationConsumer(HeartbeatMixin, AsyncWebsocketConsumer):
     async def connect(self):
         # Extract driver ID from URL route or query param
         user_id = self.scope['url_route']['kwargs'].get('user_id')
@@ -18,14 +22,15 @@ class DriverNotificationConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
         
-        # Verify this is a driver
-        is_driver = await self.is_user_driver(user_id)
-        if not is_driver:
+        # Verify this is a driver from the token claims (no DB lookup)
+        identity = await authenticate_connection(self.scope, 'DRIVER')
+        if identity is None or identity['driver_id'] is None:
             logger.warning(f"WebSocket connection attempt by non-driver user: {user_id}")
             await self.close()
             return
         
         self.driver_id = user_id
+        self.driver_pk = identity['driver_id']
         self.notification_group_name = f'driver_{self.driver_id}_notifications'
         
         # Add to driver's notification group
@@ -36,6 +41,10 @@ class DriverNotificationConsumer(AsyncWebsocketConsumer):
         
         logger.info(f"Driver {user_id} connected to WebSocket")
         await self.accept()
+        self.start_heartbeat([self.notification_group_name])
+        
+        # Resend ride requests and cancellations missed while disconnected
+        await replay_missed(self, self.notification_group_name)
     
     async def disconnect(self, close_code):
         if hasattr(self, 'notification_group_name'):
@@ -45,13 +54,25 @@ class DriverNotificationConsumer(AsyncWebsocketConsumer):
                 self.channel_name
             )
             logger.info(f"Driver {self.driver_id} disconnected from WebSocket with code {close_code}")
+        
+        if hasattr(self, 'driver_pk'):
+            # Persist the last streamed position rather than waiting for the next tick
+            await database_sync_to_async(position_store.flush)([self.driver_pk], force=True)
     
     async def receive(self, text_data):
+        # Answer the client's periodic ping without a JSON round trip
+        pong = pong_frame(text_data)
+        if pong is not None:
+            await self.send(text_data=pong)
+            return
+        
         try:
             data = json.loads(text_data)
             message_type = data.get('type')
             
-            if message_type == 'ping':
+            if message_type == 'location':
+                await self.receive_location(data)
+            elif message_type == 'ping':
                 # Handle ping messages to keep connection alive
                 await self.send(text_data=json.dumps({
                     'type': 'pong',
@@ -65,7 +86,7 @@ class DriverNotificationConsumer(AsyncWebsocketConsumer):
     async def ride_notification(self, event):
         # Send ride notification to driver
         try:
-            await self.send(text_data=json.dumps({
+            await self.send(text_data=event_text(event) or json.dumps({
                 'type': 'new_ride_request',
                 'ride': event['ride']
             }))
@@ -76,7 +97,7 @@ class DriverNotificationConsumer(AsyncWebsocketConsumer):
     async def ride_cancelled(self, event):
         # Send cancellation notification
         try:
-            await self.send(text_data=json.dumps({
+            await self.send(text_data=event_text(event) or json.dumps({
                 'type': 'ride_cancelled',
                 'ride_id': event['ride_id']
             }))
@@ -84,16 +105,24 @@ class DriverNotificationConsumer(AsyncWebsocketConsumer):
         except Exception as e:
             logger.error(f"Error sending ride cancellation to driver {self.driver_id}: {str(e)}")
     
-    @database_sync_to_async
-    def is_user_driver(self, user_id):
-        try:
-            user = User.objects.get(id=user_id)
-            return user.user_type == 'DRIVER'
-        except User.DoesNotExist:
-            logger.warning(f"User {user_id} not found when checking if driver")
-            return False
+    async def receive_location(self, data):
+        # High-frequency position reports only touch memory; the database is
+        # written in bulk at most every DRIVER_LOCATION_FLUSH_INTERVAL seconds
+        position = parse_position(data)
+        if position is None:
+            logger.warning(f"Driver {self.driver_id} sent an invalid location: {data}")
+            return
+        
+        position_store.report(self.driver_pk, *position)
+        # Patients of an active ride get the position and ETA (throttled);
+        # the ride may have been accepted or picked up through another worker
+        if ride_tracker.lookup_due(self.driver_pk):
+            await database_sync_to_async(ride_tracker.lookup_driver)(self.driver_pk)
+        ride_tracker.driver_moved(self.driver_pk, *position)
+        if position_store.flush_due():
+            await database_sync_to_async(position_store.flush)()
 
-class UserRideStatusConsumer(AsyncWebsocketConsumer):
+class UserRideStatusConsumer(HeartbeatMixin, AsyncWebsocketConsumer):
     async def connect(self):
         # Extract user ID from URL route
         user_id = self.scope['url_route']['kwargs'].get('user_id')
@@ -102,6 +131,12 @@ class UserRideStatusConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
         
+        identity = await authenticate_connection(self.scope, 'USER')
+        if identity is None:
+            logger.warning(f"Ride status WebSocket connection attempt by unauthenticated user: {user_id}")
+            await self.close()
+            return
+        
         self.user_id = user_id
         self.ride_status_group_name = f'user_{self.user_id}_ride_status'
         
@@ -113,6 +148,14 @@ class UserRideStatusConsumer(AsyncWebsocketConsumer):
         
         logger.info(f"User {user_id} connected to ride status WebSocket")
         await self.accept()
+        self.start_heartbeat([self.ride_status_group_name])
+        
+        # Resend status updates missed while disconnected
+        await replay_missed(self, self.ride_status_group_name)
+        
+        # Give a reconnecting patient the driver's last known position right away
+        for frame in await database_sync_to_async(ride_tracker.latest_for_user)(user_id):
+            await self.send(text_data=frame)
     
     async def disconnect(self, close_code):
         if hasattr(self, 'ride_status_group_name'):
@@ -124,6 +167,12 @@ class UserRideStatusConsumer(AsyncWebsocketConsumer):
             logger.info(f"User {self.user_id} disconnected from WebSocket with code {close_code}")
     
     async def receive(self, text_data):
+        # Answer the client's periodic ping without a JSON round trip
+        pong = pong_frame(text_data)
+        if pong is not None:
+            await self.send(text_data=pong)
+            return
+        
         try:
             data = json.loads(text_data)
             message_type = data.get('type')
@@ -142,10 +191,101 @@ class UserRideStatusConsumer(AsyncWebsocketConsumer):
     async def ride_status_update(self, event):
         # Send ride status update to user
         try:
-            await self.send(text_data=json.dumps({
+            await self.send(text_data=event_text(event) or json.dumps({
                 'type': 'ride_status_update',
                 'ride': event['ride']
             }))
             logger.info(f"Sent ride status update to user {self.user_id}")
         except Exception as e:
             logger.error(f"Error sending ride status update to user {self.user_id}: {str(e)}")
+    
+    async def ride_tracking(self, event):
+        # Send the assigned driver's position and ETA to the user
+        try:
+            await self.send(text_data=event['text'])
+        except Exception as e:
+            logger.error(f"Error sending ride tracking to user {self.user_id}: {str(e)}")
+
+class AdminDashboardConsumer(HeartbeatMixin, AsyncWebsocketConsumer):
+    async def connect(self):
+        # Extract admin user ID from URL route
+        user_id = self.scope['url_route']['kwargs'].get('user_id')
+        if not user_id:
+            logger.warning("WebSocket connection attempt without user_id")
+            await self.close()
+            return
+        
+        # Verify this is an admin from the token claims
+        identity = await authenticate_connection(self.scope, 'ADMIN')
+        if identity is None:
+            logger.warning(f"Admin dashboard WebSocket connection attempt by non-admin user: {user_id}")
+            await self.close()
+            return
+        
+        self.user_id = user_id
+        self.dashboard_group_name = ADMIN_DASHBOARD_GROUP
+        
+        # Join before taking the snapshot so no change is missed; a change in
+        # both is harmless since deltas carry absolute counter values
+        await self.channel_layer.group_add(
+            self.dashboard_group_name,
+            self.channel_name
+        )
+        
+        logger.info(f"Admin {user_id} connected to dashboard WebSocket")
+        await self.accept()
+        self.start_heartbeat([self.dashboard_group_name])
+        await self.send(text_data=await self.get_snapshot())
+    
+    async def disconnect(self, close_code):
+        if hasattr(self, 'dashboard_group_name'):
+            await self.channel_layer.group_discard(
+                self.dashboard_group_name,
+                self.channel_name
+            )
+            logger.info(f"Admin {self.user_id} disconnected from dashboard WebSocket with code {close_code}")
+    
+    async def receive(self, text_data):
+        # Answer the client's periodic ping without a JSON round trip
+        pong = pong_frame(text_data)
+        if pong is not None:
+            await self.send(text_data=pong)
+            return
+        
+        try:
+            data = json.loads(text_data)
+            message_type = data.get('type')
+            
+            if message_type == 'ping':
+                # Handle ping messages to keep connection alive
+                await self.send(text_data=json.dumps({
+                    'type': 'pong',
+                    'timestamp': data.get('timestamp')
+                }))
+            elif message_type == 'snapshot':
+                # Let the client resynchronise after missing deltas
+                await self.send(text_data=await self.get_snapshot())
+        except json.JSONDecodeError:
+            logger.error(f"Admin {self.user_id} sent invalid JSON")
+        except Exception as e:
+            logger.error(f"Error in dashboard WebSocket receive for admin {self.user_id}: {str(e)}")
+    
+    async def dashboard_delta(self, event):
+        # Coalesced ride, driver and counter changes for the last tick
+        try:
+            await self.send(text_data=event['text'])
+        except Exception as e:
+            logger.error(f"Error sending dashboard delta to admin {self.user_id}: {str(e)}")
+    
+    @database_sync_to_async
+    def get_snapshot(self):
+        from adminpanel import counters
+        from rides.models import Ride
+        from rides.serializers import RideDetailSerializer
+        
+        recent_rides = Ride.objects.with_details().order_by('-created_at', '-id')[:20]
+        return encode_frame({
+            'type': 'dashboard_snapshot',
+            'counters': counters.snapshot(),
+            'recent_rides': RideDetailSerializer(recent_rides, many=True).data
+        })
@@ -0,0 +1,95 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from .dispatch import get_outbox, build_message
+
+logger = logging.getLogger(__name__)
+
+ADMIN_DASHBOARD_GROUP = 'admin_dashboard'
+
+class DeltaCoalescer:
+    """Collects admin dashboard changes and pushes them at most once per tick.
+
+    Repeated changes to the same ride or driver collapse into its latest
+    status, so the admin group receives one 'dashboard_delta' message per
+    interval however busy the system is. Counters are sent as their current
+    values, read from the database when the tick is flushed: a dashboard
+    that joined the group before taking its snapshot may see a change in
+    both, which is harmless for absolute values where a summed delta would
+    be counted twice. The read runs on one long-lived worker thread, off
+    the outbox's event loop.
+    """
+
+    def __init__(self, interval=0.25):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._rides = {}
+        self._drivers = {}
+        self._counters = set()
+        self._scheduled = False
+        self._executor = None
+
+    def ride_changed(self, ride_id, status):
+        with self._lock:
+            self._rides[ride_id] = status
+            self._schedule()
+
+    def driver_changed(self, driver_id, status):
+        with self._lock:
+            self._drivers[driver_id] = status
+            self._schedule()
+
+    def counters_changed(self, changes):
+        with self._lock:
+            self._counters.update(name for name, delta in changes.items() if delta)
+            self._schedule()
+
+    def _schedule(self):
+        if not self._scheduled:
+            self._scheduled = True
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(1, thread_name_prefix='dashboard-deltas')
+            get_outbox().call_later(self.interval, lambda: self._executor.submit(self.flush))
+
+    def flush(self):
+        with self._lock:
+            rides, self._rides = self._rides, {}
+            drivers, self._drivers = self._drivers, {}
+            names, self._counters = self._counters, set()
+            self._scheduled = False
+
+        if not (rides or drivers or names):
+            return
+
+        try:
+            counter_values = {}
+            if names:
+                from adminpanel.models import DashboardCounter
+                counter_values = dict(DashboardCounter.objects.filter(name__in=names).values_list('name', 'value'))
+
+            get_outbox().enqueue(ADMIN_DASHBOARD_GROUP, build_message('dashboard_delta', {
+                'type': 'dashboard_delta',
+                'rides': [{'id': ride_id, 'status': s} for ride_id, s in rides.items()],
+                'drivers': [{'id': driver_id, 'status': s} for driver_id, s in drivers.items()],
+                'counters': counter_values,
+            }))
+        except Exception as e:
+            logger.error(f"Failed to push dashboard changes: {str(e)}", exc_info=True)
+        finally:
+            close_old_connections()
+
+dashboard_deltas = DeltaCoalescer(getattr(settings, 'DASHBOARD_PUSH_INTERVAL', 0.25))
+
+# Publish only once the change is committed, so rolled back saves never reach admins
+
+def publish_ride_status(ride_id, status):
+    transaction.on_commit(lambda: dashboard_deltas.ride_changed(ride_id, status))
+
+def publish_driver_status(driver_id, status):
+    transaction.on_commit(lambda: dashboard_deltas.driver_changed(driver_id, status))
+
+def publish_counter_changes(changes):
+    changes = dict(changes)
+    transaction.on_commit(lambda: dashboard_deltas.counters_changed(changes))
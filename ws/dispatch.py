@@ -0,0 +1,242 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from asgiref.sync import SyncToAsync, async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+from .replay import replay_buffer
+
+logger = logging.getLogger(__name__)
+
+class BaseOutbox(ABC):
+    """Hands websocket group messages to the channel layer off the request thread"""
+
+    def enqueue(self, group, message):
+        self.enqueue_many([group], message)
+
+    def enqueue_many(self, groups, message):
+        groups = list(groups)
+        if groups:
+            # Replayable messages get a per-group sequence number here
+            self.enqueue_pairs(replay_buffer.stamp(groups, message))
+
+    @abstractmethod
+    def enqueue_pairs(self, pairs):
+        """Queue (group, message) pairs for delivery"""
+
+    def call_later(self, delay, callback):
+        """Run callback after delay seconds alongside the outbox's sends"""
+        timer = threading.Timer(delay, callback)
+        timer.daemon = True
+        timer.start()
+
+    def flush(self, timeout=None):
+        """Block until everything queued so far has been sent or given up on"""
+        return True
+
+    def close(self):
+        pass
+
+def encode_frame(frame):
+    """JSON-encode a client frame once so every recipient can reuse the text"""
+    return json.dumps(frame, cls=DjangoJSONEncoder, separators=(',', ':'))
+
+def build_message(handler, frame, **extra):
+    """Channel-layer message for a consumer handler carrying a pre-encoded client frame"""
+    return {'type': handler, 'text': encode_frame(frame), **extra}
+
+async def send_batch(channel_layer, sends):
+    """Send (group, message) pairs concurrently, returning one result or exception per pair"""
+    if hasattr(channel_layer, 'group_send_batch'):
+        # Layers that can batch (ws.layers.ShardedChannelLayer) take the whole set at once
+        return await channel_layer.group_send_batch(sends)
+    return await asyncio.gather(
+        *(channel_layer.group_send(group, message) for group, message in sends),
+        return_exceptions=True,
+    )
+
+async def group_send_many(channel_layer, groups, message):
+    """Send one message to many groups concurrently on the current event loop"""
+    return await send_batch(channel_layer, [(group, message) for group in groups])
+
+def send_to_groups(groups, message):
+    """Send one message to many groups in a single event-loop hop; returns the failed groups"""
+    groups = list(groups)
+    if not groups:
+        return []
+    results = async_to_sync(group_send_many)(get_channel_layer(), groups, message)
+    failed = []
+    for group, result in zip(groups, results):
+        if isinstance(result, Exception):
+            logger.error(f"Failed to send {message.get('type')} to {group}: {str(result)}")
+            failed.append(group)
+    return failed
+
+class ImmediateOutbox(BaseOutbox):
+    """Sends inline on the calling thread; meant for tests and management commands"""
+
+    def enqueue_pairs(self, pairs):
+        results = async_to_sync(send_batch)(get_channel_layer(), pairs)
+        for (group, message), result in zip(pairs, results):
+            if isinstance(result, Exception):
+                logger.error(f"Failed to send {message.get('type')} to {group}: {str(result)}")
+
+class LocalOutbox(BaseOutbox):
+    """In-process outbox drained by an asyncio worker.
+
+    Messages are queued without blocking the caller. The worker drains up to
+    batch_size of them per pass and sends them concurrently; failed sends are
+    rescheduled with exponential backoff on the event loop instead of sleeping.
+    The worker runs on the ASGI server's event loop when enqueued from a view
+    served by it, otherwise on a private daemon thread.
+    """
+
+    def __init__(self, batch_size=200, max_retries=5, retry_delay=0.5):
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._lock = threading.Lock()
+        self._loop = None
+        self._queue = None
+        self._unfinished = 0
+        self._idle = None
+
+    def _current_loop(self):
+        try:
+            return asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        # Sync code called from an ASGI view: reuse the server loop like async_to_sync does
+        if getattr(SyncToAsync.threadlocal, 'main_event_loop_pid', None) == os.getpid():
+            loop = getattr(SyncToAsync.threadlocal, 'main_event_loop', None)
+            if loop is not None and loop.is_running():
+                return loop
+        return None
+
+    def _ensure_started(self):
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            return loop
+
+        with self._lock:
+            if self._loop is not None and not self._loop.is_closed():
+                return self._loop
+
+            loop = self._current_loop()
+            if loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='ws-outbox', daemon=True).start()
+
+            ready = threading.Event()
+
+            def start():
+                self._queue = asyncio.Queue()
+                self._idle = asyncio.Event()
+                self._idle.set()
+                self._unfinished = 0
+                loop.create_task(self._worker())
+                ready.set()
+
+            if self._current_loop() is loop:
+                start()
+            else:
+                loop.call_soon_threadsafe(start)
+                ready.wait()
+            self._loop = loop
+            return loop
+
+    def enqueue_pairs(self, pairs):
+        loop = self._ensure_started()
+        item = (pairs, 0)
+        try:
+            if asyncio.get_running_loop() is loop:
+                self._put(item)
+                return
+        except RuntimeError:
+            pass
+        loop.call_soon_threadsafe(self._put, item)
+
+    def call_later(self, delay, callback):
+        loop = self._ensure_started()
+        loop.call_soon_threadsafe(loop.call_later, delay, callback)
+
+    def _put(self, item):
+        self._unfinished += 1
+        self._idle.clear()
+        self._queue.put_nowait(item)
+
+    def _done(self):
+        self._unfinished -= 1
+        if self._unfinished == 0:
+            self._idle.set()
+
+    async def _worker(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            try:
+                await self._send(batch)
+            except Exception as e:
+                logger.error(f"Outbox worker failed to send batch: {str(e)}", exc_info=True)
+                for _ in batch:
+                    self._done()
+
+    async def _send(self, batch):
+        channel_layer = get_channel_layer()
+        sends = [(group, message, attempt) for pairs, attempt in batch for group, message in pairs]
+        results = await send_batch(channel_layer, [(group, message) for group, message, _ in sends])
+
+        failed = {}
+        for (group, message, attempt), result in zip(sends, results):
+            if not isinstance(result, Exception):
+                continue
+            if attempt + 1 < self.max_retries:
+                logger.warning(f"Attempt {attempt+1} failed to send {message.get('type')} to {group}: {str(result)}")
+                failed.setdefault(attempt, []).append((group, message))
+            else:
+                logger.error(f"Failed to send {message.get('type')} to {group} after {self.max_retries} attempts: {str(result)}")
+
+        # Retries stay counted as unfinished until they are sent or dropped
+        for attempt, pairs in failed.items():
+            self._unfinished += 1
+            delay = self.retry_delay * (2 ** attempt)
+            asyncio.get_running_loop().call_later(delay, self._retry, (pairs, attempt + 1))
+
+        for _ in batch:
+            self._done()
+
+    def _retry(self, item):
+        self._queue.put_nowait(item)
+
+    def flush(self, timeout=None):
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return True
+        future = asyncio.run_coroutine_threadsafe(self._idle.wait(), loop)
+        try:
+            future.result(timeout)
+            return True
+        except Exception:
+            future.cancel()
+            return False
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+def get_outbox():
+    """Return the process-wide outbox configured by settings.WS_OUTBOX"""
+    global _outbox
+    if _outbox is None:
+        with _outbox_lock:
+            if _outbox is None:
+                config = getattr(settings, 'WS_OUTBOX', {})
+                backend = import_string(config.get('BACKEND', 'ws.dispatch.LocalOutbox'))
+                _outbox = backend(**config.get('OPTIONS', {}))
+    return _outbox
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import math
+import re
+import sys
+import time
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# The frontend pings as {"type":"ping","timestamp":<ms>} every 30 seconds
+PING_RE = re.compile(r'^\{"type":\s*"ping",\s*"timestamp":\s*(\d+|null)\}$')
+
+def pong_frame(text_data):
+    """Pong text for a standard client ping, or None if text_data is anything else"""
+    match = PING_RE.match(text_data or '')
+    if match is None:
+        return None
+    return '{"type":"pong","timestamp":%s}' % match.group(1)
+
+class HeartbeatWheel:
+    """Timer wheel that reaps websocket connections with no inbound traffic.
+
+    One task per process advances the wheel every `tick` seconds. Inbound
+    frames only record a timestamp; when a connection's slot comes round it
+    is either reaped (idle for idle_timeout) or moved to the slot of its new
+    deadline. Reaped consumers leave their groups before being closed, so
+    broadcasts stop going to dead peers even if the server never reports
+    the disconnect.
+    """
+
+    def __init__(self, idle_timeout=75, tick=5, report_interval=300):
+        self.idle_timeout = idle_timeout
+        self.tick = tick
+        self.report_interval = report_interval
+        self._slots = [set() for _ in range(math.ceil(idle_timeout / tick) + 1)]
+        self._cursor = 0
+        self._last_seen = {}  # consumer -> monotonic time of its last inbound frame
+        self._task = None
+        self._loop = None
+        self.reaped = 0
+
+    def register(self, consumer):
+        self._ensure_running()
+        self._last_seen[consumer] = time.monotonic()
+        self._schedule(consumer, self.idle_timeout)
+
+    def touch(self, consumer):
+        if consumer in self._last_seen:
+            self._last_seen[consumer] = time.monotonic()
+
+    def unregister(self, consumer):
+        # Its slot entry is dropped when the wheel reaches it
+        self._last_seen.pop(consumer, None)
+
+    def _schedule(self, consumer, delay):
+        ticks = min(max(1, math.ceil(delay / self.tick)), len(self._slots) - 1)
+        self._slots[(self._cursor + ticks) % len(self._slots)].add(consumer)
+
+    def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        last_report = time.monotonic()
+        while True:
+            await asyncio.sleep(self.tick)
+            self.advance()
+            if self.report_interval and time.monotonic() - last_report >= self.report_interval:
+                last_report = time.monotonic()
+                stats = self.stats()
+                logger.info(
+                    f"{stats['connections']} websocket connections, ~{stats['bytes_per_connection']} bytes each, "
+                    f"{stats['reaped']} reaped so far"
+                )
+
+    def advance(self):
+        """Move the wheel one tick, reaping or rescheduling the connections in the slot"""
+        self._cursor = (self._cursor + 1) % len(self._slots)
+        due, self._slots[self._cursor] = self._slots[self._cursor], set()
+        now = time.monotonic()
+        for consumer in due:
+            last_seen = self._last_seen.get(consumer)
+            if last_seen is None:
+                continue
+            remaining = last_seen + self.idle_timeout - now
+            if remaining > 0:
+                self._schedule(consumer, remaining)
+                continue
+            del self._last_seen[consumer]
+            self.reaped += 1
+            asyncio.ensure_future(consumer.reap())
+
+    def stats(self):
+        """Connection count, reaped total and a shallow per-connection memory estimate"""
+        consumers = list(self._last_seen)
+        sample = consumers[:100]
+        sizes = [
+            sys.getsizeof(consumer) + sys.getsizeof(vars(consumer))
+            + sum(sys.getsizeof(value) for value in vars(consumer).values())
+            for consumer in sample
+        ]
+        return {
+            'connections': len(consumers),
+            'reaped': self.reaped,
+            'bytes_per_connection': sum(sizes) // len(sizes) if sizes else 0,
+        }
+
+heartbeat = HeartbeatWheel(
+    idle_timeout=getattr(settings, 'WS_IDLE_TIMEOUT', 75),
+    tick=getattr(settings, 'WS_HEARTBEAT_TICK', 5),
+    report_interval=getattr(settings, 'WS_CONNECTION_REPORT_INTERVAL', 300),
+)
+
+class HeartbeatMixin:
+    """AsyncWebsocketConsumer mixin that registers the connection with the heartbeat wheel"""
+
+    heartbeat_groups = ()
+
+    def start_heartbeat(self, groups):
+        """Call after accept(); groups are left when the connection is reaped"""
+        self.heartbeat_groups = list(groups)
+        heartbeat.register(self)
+
+    async def websocket_receive(self, message):
+        heartbeat.touch(self)
+        await super().websocket_receive(message)
+
+    async def websocket_disconnect(self, message):
+        heartbeat.unregister(self)
+        await super().websocket_disconnect(message)
+
+    async def reap(self):
+        logger.info(f"Reaping idle websocket connection {self.channel_name}")
+        try:
+            for group in self.heartbeat_groups:
+                await self.channel_layer.group_discard(group, self.channel_name)
+            await self.close(code=4408)
+        except Exception as e:
+            logger.error(f"Error reaping websocket connection {self.channel_name}: {str(e)}")
@@ -0,0 +1,432 @@
+import asyncio
+import bisect
+import hashlib
+import itertools
+import json
+import logging
+import os
+import struct
+import time
+import uuid
+import weakref
+from collections import deque
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+logger = logging.getLogger(__name__)
+
+# Wire format shared by the broker and the layer: a 4-byte big-endian length
+# followed by a compact JSON array. Requests are [id, op, *args] and
+# responses [id, ok, result]. Channel-layer messages must be JSON-serializable.
+HEADER = struct.Struct('>I')
+
+def encode(payload):
+    data = json.dumps(payload, separators=(',', ':')).encode()
+    return HEADER.pack(len(data)) + data
+
+async def read_frame(reader):
+    header = await reader.readexactly(HEADER.size)
+    return json.loads(await reader.readexactly(HEADER.unpack(header)[0]))
+
+class HashRing:
+    """Consistent hash ring mapping group and channel names to broker nodes.
+
+    Each node gets `replicas` points on the ring, so adding or removing a node
+    only moves the names that hashed next to its points.
+    """
+
+    def __init__(self, nodes, replicas=64):
+        if not nodes:
+            raise ValueError("HashRing needs at least one node")
+        self.nodes = list(nodes)
+        points = sorted(
+            (self._hash(f'{node}#{i}'), index)
+            for index, node in enumerate(self.nodes)
+            for i in range(replicas)
+        )
+        self._keys = [key for key, _ in points]
+        self._indexes = [index for _, index in points]
+
+    @staticmethod
+    def _hash(name):
+        return int.from_bytes(hashlib.md5(name.encode()).digest()[:8], 'big')
+
+    def index_for(self, name):
+        if len(self.nodes) == 1:
+            return 0
+        position = bisect.bisect(self._keys, self._hash(name)) % len(self._keys)
+        return self._indexes[position]
+
+    def node_for(self, name):
+        return self.nodes[self.index_for(name)]
+
+class ChannelBroker:
+    """One shard of the local channel layer, served over a Unix socket.
+
+    Holds per-channel message queues (bounded by the capacity the client
+    sends along, expired after `expiry` seconds) and the memberships of the
+    groups hashed to it. Blocking receives are parked as futures and handed
+    the next message directly.
+    """
+
+    def __init__(self, expiry=60, group_expiry=86400):
+        self.expiry = expiry
+        self.group_expiry = group_expiry
+        self._queues = {}   # channel -> deque of (expires_at, message)
+        self._waiters = {}  # channel -> deque of futures
+        self._groups = {}   # group -> {channel: expires_at}
+
+    async def serve(self, path):
+        if os.path.exists(path):
+            os.unlink(path)
+        server = await asyncio.start_unix_server(self._handle_client, path=path)
+        logger.info(f"Channel broker listening on {path}")
+        sweeper = asyncio.ensure_future(self._sweep_forever())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            sweeper.cancel()
+
+    async def _sweep_forever(self):
+        # Channels of closed consumers are never read again; drop what expired
+        while True:
+            await asyncio.sleep(self.expiry)
+            self.sweep()
+
+    def sweep(self):
+        now = time.time()
+        for channel in list(self._queues):
+            queue = self._queues[channel]
+            self._expire(queue, now)
+            if not queue:
+                del self._queues[channel]
+        for group in list(self._groups):
+            members = self._groups[group]
+            for channel in [channel for channel, expires_at in members.items() if expires_at < now]:
+                del members[channel]
+            if not members:
+                del self._groups[group]
+
+    async def _handle_client(self, reader, writer):
+        receives = {}  # request id -> task, so a client can cancel its receive
+
+        def respond(request_id, ok, result):
+            if not writer.is_closing():
+                writer.write(encode([request_id, ok, result]))
+
+        async def run_receive(request_id, channel):
+            try:
+                respond(request_id, True, await self.receive(channel))
+            finally:
+                receives.pop(request_id, None)
+
+        try:
+            while True:
+                request_id, op, *args = await read_frame(reader)
+                if op == 'receive':
+                    receives[request_id] = asyncio.ensure_future(run_receive(request_id, *args))
+                elif op == 'cancel':
+                    task = receives.pop(args[0], None)
+                    if task is not None:
+                        task.cancel()
+                else:
+                    try:
+                        respond(request_id, True, getattr(self, f'op_{op}')(*args))
+                    except ChannelFull:
+                        respond(request_id, False, 'full')
+                    except Exception as e:
+                        respond(request_id, False, str(e))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for task in receives.values():
+                task.cancel()
+            writer.close()
+
+    def _expire(self, queue, now):
+        while queue and queue[0][0] < now:
+            queue.popleft()
+
+    def _deliver(self, channel, message, capacity, now):
+        waiters = self._waiters.get(channel)
+        while waiters:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(message)
+                return True
+
+        queue = self._queues.get(channel)
+        if queue is None:
+            queue = self._queues[channel] = deque()
+        self._expire(queue, now)
+        if len(queue) >= capacity:
+            return False
+        queue.append((now + self.expiry, message))
+        return True
+
+    async def receive(self, channel):
+        queue = self._queues.get(channel)
+        if queue:
+            self._expire(queue, time.time())
+            if queue:
+                message = queue.popleft()[1]
+                if not queue:
+                    del self._queues[channel]
+                return message
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(channel, deque()).append(waiter)
+        try:
+            return await waiter
+        finally:
+            waiters = self._waiters.get(channel)
+            if waiters is not None:
+                if waiter in waiters:
+                    waiters.remove(waiter)
+                if not waiters:
+                    del self._waiters[channel]
+
+    def op_send(self, channel, message, capacity):
+        if not self._deliver(channel, message, capacity, time.time()):
+            raise ChannelFull(channel)
+        return True
+
+    def op_send_many(self, sends):
+        """Deliver [channel, message, capacity] triples; returns how many were full"""
+        now = time.time()
+        return sum(1 for channel, message, capacity in sends if not self._deliver(channel, message, capacity, now))
+
+    def op_group_add(self, group, channel):
+        self._groups.setdefault(group, {})[channel] = time.time() + self.group_expiry
+        return True
+
+    def op_group_discard(self, group, channel):
+        members = self._groups.get(group)
+        if members is not None:
+            members.pop(channel, None)
+            if not members:
+                del self._groups[group]
+        return True
+
+    def op_group_channels(self, groups):
+        """Current members of each of the given groups"""
+        now = time.time()
+        result = []
+        for group in groups:
+            members = self._groups.get(group, {})
+            for channel in [channel for channel, expires_at in members.items() if expires_at < now]:
+                del members[channel]
+            result.append(list(members))
+        return result
+
+    def op_flush(self):
+        self._queues.clear()
+        self._groups.clear()
+        return True
+
+class BrokerConnection:
+    """Pipelined connection to one broker, bound to the event loop that opened it.
+
+    Requests issued in the same loop iteration are written to the socket
+    together, and responses are matched back to callers by request id.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._outgoing = []
+        self._writer = None
+        self._opening = None
+
+    async def _ensure_open(self):
+        if self._writer is not None and not self._writer.is_closing():
+            return
+        if self._opening is None:
+            self._opening = asyncio.ensure_future(self._open())
+        try:
+            await asyncio.shield(self._opening)
+        finally:
+            if self._opening is not None and self._opening.done():
+                self._opening = None
+
+    async def _open(self):
+        reader, self._writer = await asyncio.open_unix_connection(self.path)
+        asyncio.ensure_future(self._read_responses(reader, self._writer))
+
+    async def _read_responses(self, reader, writer):
+        try:
+            while True:
+                request_id, ok, result = await read_frame(reader)
+                future = self._pending.pop(request_id, None)
+                if future is None or future.done():
+                    continue
+                if ok:
+                    future.set_result(result)
+                elif result == 'full':
+                    future.set_exception(ChannelFull(result))
+                else:
+                    future.set_exception(RuntimeError(result))
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            logger.warning(f"Lost connection to channel broker {self.path}: {str(e)}")
+        finally:
+            writer.close()
+            if self._writer is writer:
+                self._writer = None
+            pending, self._pending = self._pending, {}
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError(f"Channel broker {self.path} disconnected"))
+
+    def _write(self, payload):
+        if not self._outgoing:
+            asyncio.get_running_loop().call_soon(self._flush_outgoing)
+        self._outgoing.append(encode(payload))
+
+    def _flush_outgoing(self):
+        frames, self._outgoing = self._outgoing, []
+        if self._writer is not None and not self._writer.is_closing():
+            self._writer.write(b''.join(frames))
+            return
+        # The connection dropped after these were queued; the next call reconnects
+        pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError(f"Channel broker {self.path} disconnected"))
+
+    async def call(self, op, *args):
+        await self._ensure_open()
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        self._write([request_id, op, *args])
+        try:
+            return await future
+        except asyncio.CancelledError:
+            self._pending.pop(request_id, None)
+            if op == 'receive':
+                self._write([next(self._ids), 'cancel', request_id])
+            raise
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+class ShardedChannelLayer(BaseChannelLayer):
+    """Channel layer spread over several ChannelBroker processes.
+
+    Channels and groups are placed on brokers by consistent hashing of their
+    names. group_send looks up the members on the group's broker and then
+    delivers with one send_many per broker holding member channels;
+    group_send_batch does the same for many groups at once. Group sends to a
+    full channel are dropped, as in the other channel layers.
+
+    Start the brokers with `python manage.py run_channel_broker`.
+    """
+
+    extensions = ['groups', 'flush']
+
+    def __init__(self, hosts=None, prefix='asgi', expiry=60, group_expiry=86400,
+                 capacity=100, channel_capacity=None, replicas=64):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity)
+        self.channel_capacity = self.compile_capacities(self.channel_capacity)
+        self.hosts = list(hosts or ['/tmp/ambuk-channels-0.sock'])
+        self.prefix = prefix
+        self.group_expiry = group_expiry
+        self.ring = HashRing(self.hosts, replicas)
+        self.client_prefix = uuid.uuid4().hex
+        self._connections = weakref.WeakKeyDictionary()  # loop -> [BrokerConnection per host]
+
+    def _connection(self, index):
+        loop = asyncio.get_running_loop()
+        connections = self._connections.get(loop)
+        if connections is None:
+            connections = self._connections[loop] = [BrokerConnection(host) for host in self.hosts]
+        return connections[index]
+
+    def _call(self, name, op, *args):
+        return self._connection(self.ring.index_for(name)).call(op, *args)
+
+    async def new_channel(self, prefix='specific'):
+        return f'{prefix}.{self.client_prefix}!{uuid.uuid4().hex}'
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_channel_name(channel)
+        await self._call(channel, 'send', channel, message, self.get_capacity(channel))
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+        return await self._call(channel, 'receive', channel)
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        await self._call(group, 'group_add', group, channel)
+
+    async def group_discard(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        await self._call(group, 'group_discard', group, channel)
+
+    async def group_send(self, group, message):
+        result = (await self.group_send_batch([(group, message)]))[0]
+        if isinstance(result, Exception):
+            raise result
+
+    async def group_send_batch(self, sends):
+        """Send (group, message) pairs with one round trip per broker and phase.
+
+        Returns one result per pair: None, or the exception that stopped it.
+        """
+        sends = list(sends)
+        results = [None] * len(sends)
+
+        # Phase 1: members of every group, one request per group broker
+        by_node = {}
+        for position, (group, message) in enumerate(sends):
+            self.require_valid_group_name(group)
+            by_node.setdefault(self.ring.index_for(group), []).append(position)
+        lookups = list(by_node.items())
+        replies = await asyncio.gather(
+            *(self._connection(index).call('group_channels', [sends[p][0] for p in positions])
+              for index, positions in lookups),
+            return_exceptions=True,
+        )
+
+        # Phase 2: one send_many per broker holding member channels
+        deliveries = {}  # node index -> (positions, [channel, message, capacity])
+        for (_, positions), reply in zip(lookups, replies):
+            if isinstance(reply, Exception):
+                for position in positions:
+                    results[position] = reply
+                continue
+            for position, channels in zip(positions, reply):
+                message = sends[position][1]
+                for channel in channels:
+                    entry = deliveries.setdefault(self.ring.index_for(channel), ([], []))
+                    entry[0].append(position)
+                    entry[1].append([channel, message, self.get_capacity(channel)])
+
+        targets = list(deliveries.items())
+        replies = await asyncio.gather(
+            *(self._connection(index).call('send_many', batch) for index, (_, batch) in targets),
+            return_exceptions=True,
+        )
+        for (_, (positions, _)), reply in zip(targets, replies):
+            if isinstance(reply, Exception):
+                for position in positions:
+                    results[position] = reply
+            elif reply:
+                logger.debug(f"{reply} group messages dropped on full channels")
+        return results
+
+    async def flush(self):
+        await asyncio.gather(*(self._connection(index).call('flush') for index in range(len(self.hosts))))
+
+    async def close(self):
+        connections = self._connections.pop(asyncio.get_running_loop(), None)
+        for connection in connections or ():
+            connection.close()
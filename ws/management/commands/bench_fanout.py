@@ -0,0 +1,110 @@
+import asyncio
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+from django.core.management.base import BaseCommand
+from ws.layers import ShardedChannelLayer
+from .run_channel_broker import run_broker
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+async def driver_worker(hosts, expected, ready, results, timeout):
+    """Join one channel per driver to its notification group and count what arrives"""
+    layer = ShardedChannelLayer(hosts=hosts, capacity=1000)
+    latencies = []
+
+    async def listen(driver_id, count):
+        channel = await layer.new_channel()
+        await layer.group_add(f'driver_{driver_id}_notifications', channel)
+        ready.put(1)
+        for _ in range(count):
+            message = await layer.receive(channel)
+            latencies.append(time.time() - message['sent_at'])
+
+    tasks = [asyncio.ensure_future(listen(driver_id, count)) for driver_id, count in expected.items()]
+    await asyncio.wait(tasks, timeout=timeout)
+    results.put(latencies)
+
+def run_driver_worker(hosts, expected, ready, results, timeout):
+    asyncio.run(driver_worker(hosts, expected, ready, results, timeout))
+
+class Command(BaseCommand):
+    help = 'Benchmark ride_notification fan-out through the sharded channel layer across worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shards', type=int, default=2, help='Broker processes')
+        parser.add_argument('--workers', type=int, default=4, help='Consumer processes the drivers are spread over')
+        parser.add_argument('--drivers', type=int, default=400, help='Connected drivers')
+        parser.add_argument('--rides', type=int, default=1000, help='Ride requests to dispatch')
+        parser.add_argument('--fanout', type=int, default=20, help='Drivers notified per ride')
+        parser.add_argument('--timeout', type=float, default=60, help='Seconds to wait for delivery')
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        drivers = list(range(1, options['drivers'] + 1))
+        fanout = min(options['fanout'], len(drivers))
+        rides = [rng.sample(drivers, fanout) for _ in range(options['rides'])]
+        per_driver = Counter(driver_id for targets in rides for driver_id in targets)
+
+        with tempfile.TemporaryDirectory() as socket_dir:
+            hosts = [os.path.join(socket_dir, f'broker-{i}.sock') for i in range(options['shards'])]
+            processes = [multiprocessing.Process(target=run_broker, args=(path, 60, 86400), daemon=True) for path in hosts]
+            for process in processes:
+                process.start()
+            while not all(os.path.exists(path) for path in hosts):
+                time.sleep(0.05)
+
+            ready, results = multiprocessing.Queue(), multiprocessing.Queue()
+            for index in range(options['workers']):
+                expected = {driver_id: per_driver[driver_id] for driver_id in drivers[index::options['workers']]}
+                process = multiprocessing.Process(
+                    target=run_driver_worker, args=(hosts, expected, ready, results, options['timeout']), daemon=True)
+                process.start()
+                processes.append(process)
+            for _ in drivers:
+                ready.get(timeout=options['timeout'])
+
+            elapsed = asyncio.run(self.dispatch(hosts, rides))
+            latencies = sorted(
+                latency
+                for _ in range(options['workers'])
+                for latency in results.get(timeout=options['timeout'] + 5)
+            )
+
+            for process in processes:
+                process.terminate()
+
+        sent = sum(per_driver.values())
+        self.stdout.write(
+            f"{len(rides)} rides to {fanout} drivers each over {options['shards']} shards and "
+            f"{options['workers']} workers: dispatched in {elapsed:.3f}s ({len(rides) / elapsed:.0f} rides/s)"
+        )
+        self.stdout.write(
+            f"Delivered {len(latencies)}/{sent} notifications; latency "
+            f"p50 {percentile(latencies, 0.5) * 1000:.2f}ms "
+            f"p95 {percentile(latencies, 0.95) * 1000:.2f}ms "
+            f"p99 {percentile(latencies, 0.99) * 1000:.2f}ms"
+        )
+
+    async def dispatch(self, hosts, rides):
+        layer = ShardedChannelLayer(hosts=hosts, capacity=1000)
+        start = time.perf_counter()
+        for ride_id, targets in enumerate(rides, 1):
+            message = {
+                'type': 'ride_notification',
+                'text': '{"type":"new_ride_request","ride":{"id":%d}}' % ride_id,
+                'sent_at': time.time(),
+            }
+            results = await layer.group_send_batch([(f'driver_{driver_id}_notifications', message) for driver_id in targets])
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+        elapsed = time.perf_counter() - start
+        await layer.close()
+        return elapsed
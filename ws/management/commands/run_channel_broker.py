@@ -0,0 +1,44 @@
+import asyncio
+import multiprocessing
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from ws.layers import ChannelBroker
+
+def broker_config():
+    """Sockets and expiry of the sharded channel layer as configured in settings"""
+    layer = settings.CHANNEL_LAYERS.get('default', {})
+    config = layer.get('CONFIG', {}) if layer.get('BACKEND') == 'ws.layers.ShardedChannelLayer' else {}
+    return {
+        'hosts': config.get('hosts', settings.CHANNEL_BROKER_SOCKETS),
+        'expiry': config.get('expiry', 60),
+        'group_expiry': config.get('group_expiry', 86400),
+    }
+
+def run_broker(path, expiry, group_expiry):
+    asyncio.run(ChannelBroker(expiry, group_expiry).serve(path))
+
+class Command(BaseCommand):
+    help = 'Run the local channel-layer brokers used by ws.layers.ShardedChannelLayer, one process per socket'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', action='append', dest='sockets',
+                            help='Serve this socket path (repeatable); defaults to the configured hosts')
+
+    def handle(self, *args, **options):
+        config = broker_config()
+        sockets = options['sockets'] or config['hosts']
+
+        processes = [
+            multiprocessing.Process(target=run_broker, args=(path, config['expiry'], config['group_expiry']), daemon=True)
+            for path in sockets
+        ]
+        for process, path in zip(processes, sockets):
+            process.start()
+            self.stdout.write(f"Channel broker serving {path} (pid {process.pid})")
+
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
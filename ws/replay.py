@@ -0,0 +1,143 @@
+import json
+import secrets
+import threading
+import time
+from collections import deque
+from urllib.parse import parse_qs
+from django.conf import settings
+
+class ReplayBuffer:
+    """Recent messages per group, numbered so reconnecting clients can catch up.
+
+    Every buffered message gets the next sequence number of its group,
+    tagged with this buffer's origin: a random token per process, since
+    each worker numbers only what it published itself. A client that
+    reconnects with the last seq it saw is sent the messages after it, or
+    told it has a gap when the seq came from another origin. Each group
+    keeps at most max_messages for at most max_age seconds; the periodic
+    sweep forgets groups whose messages have all expired, so a later resume
+    on one is reported as a gap. A group numbered again afterwards starts
+    above every number this buffer has issued, so no seq is ever reused.
+
+    With several workers a reconnect can only catch up on what the worker
+    it lands on published; anything else is reported as a gap, and clients
+    refetch over REST.
+    """
+
+    def __init__(self, max_messages=100, max_age=300, types=()):
+        self.max_messages = max_messages
+        self.max_age = max_age
+        self.types = frozenset(types)
+        self.origin = secrets.token_hex(4)
+        self._groups = {}  # group -> [last_seq, deque of (seq, stored_at, message)]
+        self._highest = 0  # highest seq issued to any group
+        self._lock = threading.Lock()
+        self._appends = 0
+
+    def stamp(self, groups, message):
+        """Return (group, message) pairs, numbering and buffering replayable messages"""
+        if message.get('type') not in self.types or not self.max_messages:
+            return [(group, message) for group in groups]
+
+        now = time.monotonic()
+        pairs = []
+        with self._lock:
+            for group in groups:
+                state = self._groups.get(group)
+                if state is None:
+                    state = self._groups[group] = [self._highest, deque(maxlen=self.max_messages)]
+                state[0] += 1
+                self._highest = max(self._highest, state[0])
+                stamped = dict(message, seq=f'{self.origin}:{state[0]}')
+                state[1].append((state[0], now, stamped))
+                pairs.append((group, stamped))
+
+            self._appends += 1
+            if self._appends % 1000 == 0:
+                self._sweep(now)
+        return pairs
+
+    def since(self, group, origin, last_seq):
+        """Return (messages after last_seq, complete) where complete is False if some may be missing.
+
+        Only a seq numbered by this buffer can be resumed: one from another
+        origin (another worker, or before a restart) or from a group this
+        buffer never numbered is always reported incomplete.
+        """
+        now = time.monotonic()
+        with self._lock:
+            state = self._groups.get(group)
+            if origin != self.origin or state is None:
+                return [], False
+            current, messages = state
+            self._expire(messages, now)
+            missed = [message for seq, _, message in messages if seq > last_seq]
+            # Gap-free if the oldest kept message directly follows last_seq
+            first_kept = messages[0][0] if messages else current + 1
+            complete = last_seq >= current or first_kept <= last_seq + 1
+        return missed, complete
+
+    def last_seq(self, group):
+        """The seq of the group's latest message, as sent to clients"""
+        with self._lock:
+            state = self._groups.get(group)
+            return f'{self.origin}:{state[0] if state else self._highest}'
+
+    def _expire(self, messages, now):
+        while messages and now - messages[0][1] > self.max_age:
+            messages.popleft()
+
+    def _sweep(self, now):
+        for group, (_, messages) in list(self._groups.items()):
+            self._expire(messages, now)
+            if not messages:
+                del self._groups[group]
+
+replay_buffer = ReplayBuffer(
+    max_messages=getattr(settings, 'WS_REPLAY_MAX_MESSAGES', 100),
+    max_age=getattr(settings, 'WS_REPLAY_MAX_AGE', 300),
+    types=getattr(settings, 'WS_REPLAY_TYPES', ('ride_notification', 'ride_cancelled', 'ride_status_update')),
+)
+
+def event_text(event):
+    """Client frame text of a channel-layer event, with its sequence number spliced in"""
+    text = event.get('text')
+    if text is None or event.get('seq') is None:
+        return text
+    return '{"seq":"%s",%s' % (event['seq'], text[1:])
+
+def parse_last_seq(scope):
+    """The (origin, number) of a reconnecting client's ?last_seq=<origin>:<number>, or None.
+
+    A malformed seq parses with an empty origin, so it replays as a gap.
+    """
+    value = parse_qs(scope.get('query_string', b'').decode()).get('last_seq', [None])[0]
+    if value is None:
+        return None
+    origin, _, number = value.rpartition(':')
+    try:
+        return origin, int(number)
+    except ValueError:
+        return '', 0
+
+async def replay_missed(consumer, group):
+    """Send a reconnecting client what it missed on a group since ?last_seq=.
+
+    Called after joining the group, so a message may arrive both here and
+    live, and live messages published by other workers carry their own
+    origin's numbers. Seqs are therefore not ordered across frames: clients
+    drop a frame whose seq they have already seen, never one with a lower
+    number. If part of the gap cannot be replayed a replay_gap frame goes
+    first and the client should refetch its state over REST.
+    """
+    last_seq = parse_last_seq(consumer.scope)
+    if last_seq is None:
+        return 0
+    missed, complete = replay_buffer.since(group, *last_seq)
+    if not complete:
+        await consumer.send(text_data=json.dumps({'type': 'replay_gap', 'last_seq': replay_buffer.last_seq(group)}))
+    for message in missed:
+        text = event_text(message)
+        if text is not None:
+            await consumer.send(text_data=text)
+    return len(missed)
@@ -0,0 +1,162 @@
+import logging
+import threading
+import time
+from django.conf import settings
+from drivers.geo import haversine_km
+from .dispatch import get_outbox, encode_frame
+
+logger = logging.getLogger(__name__)
+
+TRACKED_STATUSES = ('ACCEPTED', 'PICKED_UP')
+TRACKED_FIELDS = ('id', 'driver_id', 'user_id', 'status',
+                  'pickup_lat', 'pickup_lng', 'destination_lat', 'destination_lng')
+
+class RideTracker:
+    """Forwards the assigned driver's position and ETA to the patient.
+
+    While a ride is ACCEPTED the ETA is to the pickup point, once PICKED_UP it
+    is to the destination. Updates are throttled to one per min_interval and
+    dropped when neither the position nor the ETA changed meaningfully. The
+    latest frame per ride is kept so a reconnecting patient gets it at once.
+
+    Transitions made in this process are tracked at once. Those made through
+    another worker reach the worker holding the driver's socket through
+    lookup_driver(), which reads the driver's active ride from the database
+    at most once per lookup_ttl seconds while the driver streams positions.
+    """
+
+    def __init__(self, min_interval=2.0, min_distance_m=25, speed_kmh=30, lookup_ttl=10.0):
+        self.min_interval = min_interval
+        self.min_distance_km = min_distance_m / 1000
+        self.speed_kmh = speed_kmh
+        self.lookup_ttl = lookup_ttl
+        self._rides = {}       # ride_id -> (driver_pk, user_id, status, target_lat, target_lng)
+        self._by_driver = {}   # driver_pk -> ride_id
+        self._last_sent = {}   # ride_id -> (monotonic, lat, lng, eta_minutes)
+        self._latest = {}      # ride_id -> frame text
+        self._looked_up = {}   # driver_pk -> monotonic time its active ride was last read
+        self._lock = threading.Lock()
+
+    def track(self, ride_id, driver_pk, user_id, status, pickup, destination):
+        if status not in TRACKED_STATUSES or driver_pk is None:
+            self.untrack(ride_id)
+            return
+        target = pickup if status == 'ACCEPTED' else destination
+        with self._lock:
+            self._rides[ride_id] = (driver_pk, user_id, status, float(target[0]), float(target[1]))
+            self._by_driver[driver_pk] = ride_id
+
+    def track_ride(self, ride):
+        self.track(ride.id, ride.driver_id, ride.user_id, ride.status,
+                   (ride.pickup_lat, ride.pickup_lng), (ride.destination_lat, ride.destination_lng))
+
+    def untrack(self, ride_id):
+        with self._lock:
+            info = self._rides.pop(ride_id, None)
+            if info is not None and self._by_driver.get(info[0]) == ride_id:
+                del self._by_driver[info[0]]
+            self._last_sent.pop(ride_id, None)
+            self._latest.pop(ride_id, None)
+
+    def lookup_due(self, driver_pk, now=None):
+        """True when the driver's active ride should be read from the database again"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            looked_up = self._looked_up.get(driver_pk)
+        return looked_up is None or now - looked_up >= self.lookup_ttl
+
+    def lookup_driver(self, driver_pk):
+        """Track the driver's active ride as stored, or untrack one that has ended.
+
+        One probe of the ride_active_driver_idx partial index; the answer,
+        including "no active ride", is trusted for lookup_ttl seconds.
+        """
+        from rides.models import Ride
+
+        ride = Ride.objects.filter(driver_id=driver_pk, status__in=TRACKED_STATUSES).only(*TRACKED_FIELDS).first()
+        now = time.monotonic()
+        if ride is not None:
+            self.track_ride(ride)
+        else:
+            with self._lock:
+                ride_id = self._by_driver.get(driver_pk)
+            if ride_id is not None:
+                self.untrack(ride_id)
+        with self._lock:
+            self._looked_up[driver_pk] = now
+            if len(self._looked_up) > 10000:
+                self._looked_up = {pk: at for pk, at in self._looked_up.items() if now - at < self.lookup_ttl}
+
+    def eta_seconds(self, distance_km):
+        return int(distance_km / self.speed_kmh * 3600)
+
+    def _frame(self, ride_id, status, target_lat, target_lng, lat, lng):
+        """(frame text, eta seconds) of a tracking update"""
+        distance_km = haversine_km(lat, lng, target_lat, target_lng)
+        eta = self.eta_seconds(distance_km)
+        return encode_frame({
+            'type': 'ride_tracking',
+            'ride_id': ride_id,
+            'status': status,
+            'driver_location': {'lat': lat, 'lng': lng},
+            'distance_km': round(distance_km, 3),
+            'eta_seconds': eta,
+            'timestamp': int(time.time() * 1000),
+        }), eta
+
+    def driver_moved(self, driver_pk, lat, lng):
+        """Push a tracking frame for the driver's active ride, if one is due"""
+        now = time.monotonic()
+        with self._lock:
+            ride_id = self._by_driver.get(driver_pk)
+            if ride_id is None:
+                return False
+            _, user_id, status, target_lat, target_lng = self._rides[ride_id]
+            frame, eta = self._frame(ride_id, status, target_lat, target_lng, lat, lng)
+            self._latest[ride_id] = frame
+
+            last = self._last_sent.get(ride_id)
+            if last is not None:
+                sent_at, last_lat, last_lng, last_eta_minutes = last
+                if now - sent_at < self.min_interval:
+                    return False
+                moved_km = haversine_km(lat, lng, last_lat, last_lng)
+                if moved_km < self.min_distance_km and eta // 60 == last_eta_minutes:
+                    return False
+            self._last_sent[ride_id] = (now, lat, lng, eta // 60)
+
+        get_outbox().enqueue(f'user_{user_id}_ride_status', {'type': 'ride_tracking', 'text': frame})
+        return True
+
+    def latest_for_user(self, user_id):
+        """Latest tracking frames for a patient's active rides, as stored in the database.
+
+        A ride whose driver streams to this process gets its last pushed
+        frame; one whose driver streams to another worker gets a frame from
+        the driver's last flushed position.
+        """
+        from rides.models import Ride
+
+        rides = (Ride.objects.filter(user_id=user_id, status__in=TRACKED_STATUSES, driver__isnull=False)
+                 .select_related('driver')
+                 .only(*TRACKED_FIELDS, 'driver__current_location_lat', 'driver__current_location_lng'))
+        frames = []
+        for ride in rides:
+            with self._lock:
+                frame = self._latest.get(ride.id)
+            lat, lng = ride.driver.current_location_lat, ride.driver.current_location_lng
+            if frame is None and lat is not None and lng is not None:
+                target = (ride.pickup_lat, ride.pickup_lng) if ride.status == 'ACCEPTED' else (
+                    ride.destination_lat, ride.destination_lng)
+                frame, _ = self._frame(ride.id, ride.status, float(target[0]), float(target[1]),
+                                       float(lat), float(lng))
+            if frame is not None:
+                frames.append(frame)
+        return frames
+
+ride_tracker = RideTracker(
+    min_interval=getattr(settings, 'RIDE_TRACKING_MIN_INTERVAL', 2.0),
+    min_distance_m=getattr(settings, 'RIDE_TRACKING_MIN_DISTANCE_M', 25),
+    speed_kmh=getattr(settings, 'RIDE_TRACKING_SPEED_KMH', 30),
+    lookup_ttl=getattr(settings, 'RIDE_TRACKING_LOOKUP_TTL', 10),
+)
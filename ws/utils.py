@@ -1,101 +1,77 @@
-
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from django.conf import settings
 from drivers.models import Driver
-from rides.serializers import RideDetailSerializer
+from drivers.geo import find_nearby_drivers
+from rides.offers import offer_registry
+from rides.payloads import ride_frame
+from .dispatch import get_outbox, build_message
 import logging
-import time
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
-def notify_available_drivers(ride):
-    """Notify all available drivers about a new ride request with guaranteed delivery"""
-    channel_layer = get_channel_layer()
+def driver_group(user_id):
+    return f'driver_{user_id}_notifications'
+
+def get_dispatch_targets(ride):
+    """Return (driver_id, user_id) pairs for the available drivers nearest the pickup point"""
+    nearby = find_nearby_drivers(ride.pickup_lat, ride.pickup_lng)
+    if nearby:
+        return [(driver_id, user_id) for _, driver_id, user_id in nearby]
     
-    # Get all available drivers
-    available_drivers = Driver.objects.filter(status='AVAILABLE')
+    if not getattr(settings, 'DISPATCH_FALLBACK_TO_BROADCAST', True):
+        return []
     
-    ride_data = RideDetailSerializer(ride).data
+    # No located driver within range - fall back to every available driver
+    logger.warning(f"No located drivers near ride {ride.id}, falling back to broadcast")
+    return list(Driver.objects.filter(status='AVAILABLE').values_list('id', 'user_id'))
+
+def notify_available_drivers(ride):
+    """Queue a new ride request notification for the nearest available drivers"""
+    # Only offer the ride to drivers close to the pickup point
+    targets = get_dispatch_targets(ride)
+    if not targets:
+        logger.warning(f"No available drivers to notify about ride {ride.id}")
+        return
+    offer_ride(ride, targets)
+
+def offer_ride(ride, targets):
+    """Send a new ride request to the given (driver_id, user_id) targets"""
+    # Remember who got the offer so a cancellation only reaches them
+    offer_registry.record(ride.id, targets)
+    groups = [driver_group(user_id) for _, user_id in targets]
     
-    # Send notification to each available driver with retry mechanism
-    for driver in available_drivers:
-        max_retries = 3
-        retry_count = 0
-        success = False
-        
-        while retry_count < max_retries and not success:
-            try:
-                async_to_sync(channel_layer.group_send)(
-                    f'driver_{driver.user.id}_notifications',
-                    {
-                        'type': 'ride_notification',
-                        'ride': ride_data
-                    }
-                )
-                logger.info(f"Successfully notified driver {driver.id} about ride {ride.id}")
-                success = True
-            except Exception as e:
-                retry_count += 1
-                logger.warning(f"Attempt {retry_count} failed to notify driver {driver.id}: {str(e)}")
-                if retry_count < max_retries:
-                    time.sleep(0.5 * retry_count)  # Exponential backoff
-                else:
-                    logger.error(f"Failed to notify driver {driver.id} after {max_retries} attempts: {str(e)}")
+    # The frame reuses the cached ride payload and is shared by every
+    # recipient; delivery and retries happen on the outbox worker
+    get_outbox().enqueue_many(groups, {
+        'type': 'ride_notification',
+        'text': ride_frame('new_ride_request', ride)
+    })
+    logger.info(f"Queued notification of ride {ride.id} for {len(groups)} drivers")
 
 def send_ride_update(ride):
-    """Send ride status update to the user with improved reliability and guaranteed delivery"""
-    channel_layer = get_channel_layer()
-    
-    ride_data = RideDetailSerializer(ride).data
-    
+    """Queue a ride status update for the user; returns False if there is nobody to notify"""
     # Ensure we have a user to notify
-    if not ride.user:
+    if not ride.user_id:
         logger.warning(f"No user associated with ride {ride.id} for status update")
         return False
     
-    # Try to send with exponential backoff retry
-    max_retries = 5  # Increased from 3 to 5
-    base_delay = 0.5  # Start with 500ms delay
-    
-    for attempt in range(max_retries):
-        try:
-            # Send update to user
-            async_to_sync(channel_layer.group_send)(
-                f'user_{ride.user.id}_ride_status',
-                {
-                    'type': 'ride_status_update',
-                    'ride': ride_data
-                }
-            )
-            logger.info(f"Successfully sent ride update to user {ride.user.id} for ride {ride.id}: {ride.status} (attempt {attempt+1})")
-            return True
-        except Exception as e:
-            delay = base_delay * (2 ** attempt)  # Exponential backoff
-            logger.warning(f"Attempt {attempt+1} failed to send ride update to user {ride.user.id}: {str(e)}, retrying in {delay}s")
-            
-            if attempt < max_retries - 1:  # Don't sleep after the last attempt
-                time.sleep(delay)
-            else:
-                logger.error(f"Failed to send ride update after {max_retries} attempts: {str(e)}")
-                return False
+    get_outbox().enqueue(f'user_{ride.user_id}_ride_status', {
+        'type': 'ride_status_update',
+        'text': ride_frame('ride_status_update', ride)
+    })
+    logger.info(f"Queued ride update to user {ride.user_id} for ride {ride.id}: {ride.status}")
+    return True
 
 def broadcast_ride_cancellation(ride_id, user_id):
-    """Broadcast ride cancellation to all drivers"""
-    channel_layer = get_channel_layer()
-    
-    # Get all drivers to notify about cancellation
-    drivers = Driver.objects.all()
+    """Tell the drivers who were offered a ride that it has been cancelled"""
+    groups = [driver_group(driver_user_id) for _, driver_user_id in offer_registry.targets(ride_id)]
+    offer_registry.forget(ride_id)
+    if not groups:
+        logger.info(f"Ride {ride_id} was not offered to any driver, no cancellation to send")
+        return
     
-    for driver in drivers:
-        try:
-            async_to_sync(channel_layer.group_send)(
-                f'driver_{driver.user.id}_notifications',
-                {
-                    'type': 'ride_cancelled',
-                    'ride_id': ride_id
-                }
-            )
-            logger.info(f"Notified driver {driver.id} about cancellation of ride {ride_id}")
-        except Exception as e:
-            logger.error(f"Failed to notify driver {driver.id} about cancellation: {str(e)}")
+    get_outbox().enqueue_many(groups, build_message('ride_cancelled', {
+        'type': 'ride_cancelled',
+        'ride_id': ride_id
+    }, ride_id=ride_id))
+    logger.info(f"Queued cancellation of ride {ride_id} for {len(groups)} drivers")